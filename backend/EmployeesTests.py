@@ -1,13 +1,20 @@
 import unittest  # libreria de python para realizar test
 from config.qa import config
-from app.models import Employee, Department, User
+from app.models import db, Employee, Department, User, ArchivedEmployee, RevokedToken
+from app import archive, search, passwords
 from app.authentication import authorize
 from app import create_app
 from flask_sqlalchemy import SQLAlchemy
 import json
+import jwt
+import os
+import signal
+import time
 import io as io
+import gzip
 import random
 import string
+from datetime import datetime
 
 
 def random_username(char_num):
@@ -18,7 +25,8 @@ def random_username(char_num):
 class EmployeesTests(unittest.TestCase):
     def setUp(self):
         database_path = config['DATABASE_URI']
-        self.app = create_app({'database_path': database_path})
+        self.app = create_app({'database_path': database_path,
+                               'enforce_query_budgets': True})
         self.client = self.app.test_client()
 
         self.new_department = {
@@ -132,6 +140,69 @@ class EmployeesTests(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertTrue(data['message'])
 
+    def test_create_employees_bulk_success(self):
+        response_dpto_tmp = self.client.post(
+            '/departments', json=self.new_department, headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+        data_tmp = json.loads(response_dpto_tmp.data)
+        self.new_employee['selectDepartment'] = str(data_tmp['department']['id'])
+
+        response = self.client.post('/employees/bulk?batch_size=1', json=[
+            self.new_employee, self.new_employee, self.invalid_new_employee], headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(data['created']), 2)
+        self.assertEqual(data['errors'][0]['row'], 3)
+
+    def test_create_employees_bulk_csv_success(self):
+        response_dpto_tmp = self.client.post(
+            '/departments', json=self.new_department, headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+        data_tmp = json.loads(response_dpto_tmp.data)
+        dpto_tmp_id = data_tmp['department']['id']
+
+        csv_content = 'firstname,lastname,age,selectDepartment\nBianca,Aguinaga,16,{}\n'.format(dpto_tmp_id)
+        form_data = {'file': (io.BytesIO(csv_content.encode('utf-8')), 'employees.csv')}
+
+        response = self.client.post(
+            '/employees/bulk', data=form_data, content_type='multipart/form-data', headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(data['created']), 1)
+
+    def test_create_employees_bulk_failed_400(self):
+        response = self.client.post('/employees/bulk', json=[self.invalid_new_employee], headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertTrue(data['errors'])
+
+    def test_create_employees_bulk_invalid_fields_success(self):
+        response_dpto_tmp = self.client.post(
+            '/departments', json=self.new_department, headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+        self.new_employee['selectDepartment'] = json.loads(response_dpto_tmp.data)['department']['id']
+
+        response = self.client.post('/employees/bulk', json=[
+            dict(self.new_employee, firstname=None),
+            dict(self.new_employee, firstname=['Bianca']),
+            dict(self.new_employee, lastname='A' * 121),
+            dict(self.new_employee, age=2 ** 40),
+            self.new_employee], headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(data['created']), 1)
+        self.assertEqual([error['row'] for error in data['errors']], [1, 2, 3, 4])
+
     # test of /files
 
     def test_upload_file_success(self):
@@ -166,6 +237,115 @@ class EmployeesTests(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(data['message'])
 
+    def test_upload_file_deduplicated_success(self):
+        response_dpto_tmp = self.client.post(
+            '/departments', json=self.new_department, headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+        data_tmp = json.loads(response_dpto_tmp.data)
+        self.new_employee['selectDepartment'] = str(data_tmp['department']['id'])
+
+        response = self.client.post('/employees', json=self.new_employee, headers={
+                                    'X-ACCESS-TOKEN': self.user_valid_token})
+        emp_tmp_id = json.loads(response.data)['id']
+
+        with open('static/testImages/test.png', 'rb') as file:
+            file_content = file.read()
+
+        uploaded = []
+        for _ in range(2):
+            response = self.client.post('/files', data={
+                'employee_id': str(emp_tmp_id),
+                'image': (io.BytesIO(file_content), 'test.png'),
+            }, content_type='multipart/form-data', headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+            uploaded.append(json.loads(response.data)['file'])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertNotEqual(uploaded[0]['id'], uploaded[1]['id'])
+        self.assertEqual(uploaded[0]['content_hash'], uploaded[1]['content_hash'])
+        self.assertEqual(uploaded[0]['size'], len(file_content))
+
+    def test_get_employee_image_success(self):
+        response_dpto_tmp = self.client.post(
+            '/departments', json=self.new_department, headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+        data_tmp = json.loads(response_dpto_tmp.data)
+        self.new_employee['selectDepartment'] = str(data_tmp['department']['id'])
+
+        response = self.client.post('/employees', json=self.new_employee, headers={
+                                    'X-ACCESS-TOKEN': self.user_valid_token})
+        emp_tmp_id = json.loads(response.data)['id']
+
+        with open('static/testImages/test.png', 'rb') as file:
+            file_content = file.read()
+
+        self.client.post('/files', data={
+            'employee_id': str(emp_tmp_id),
+            'image': (io.BytesIO(file_content), 'test.png'),
+        }, content_type='multipart/form-data', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+
+        response = self.client.get('/employees/{}/image'.format(emp_tmp_id), headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, file_content)
+        self.assertTrue(response.headers['ETag'])
+
+        response = self.client.get('/employees/{}/image?size=64'.format(emp_tmp_id), headers={
+            'X-ACCESS-TOKEN': self.user_valid_token, 'Accept': 'image/webp'})
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_employee_image_failed_400(self):
+        response = self.client.get('/employees/1234/image?size=13', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_get_file_success(self):
+        response_dpto_tmp = self.client.post(
+            '/departments', json=self.new_department, headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+        data_tmp = json.loads(response_dpto_tmp.data)
+        self.new_employee['selectDepartment'] = str(data_tmp['department']['id'])
+
+        response = self.client.post('/employees', json=self.new_employee, headers={
+                                    'X-ACCESS-TOKEN': self.user_valid_token})
+        emp_tmp_id = json.loads(response.data)['id']
+
+        with open('static/testImages/test.png', 'rb') as file:
+            file_content = file.read()
+
+        response = self.client.post('/files', data={
+            'employee_id': str(emp_tmp_id),
+            'image': (io.BytesIO(file_content), 'test.png'),
+        }, content_type='multipart/form-data', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        uploaded = json.loads(response.data)['file']
+
+        response = self.client.get('/files/{}'.format(uploaded['id']), headers={
+            'X-ACCESS-TOKEN': self.user_valid_token, 'Range': 'bytes=0-9'})
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, file_content[:10])
+        self.assertEqual(response.headers['ETag'], '"{}"'.format(uploaded['content_hash']))
+
+        response = self.client.get('/files/{}'.format(uploaded['id']), headers={
+            'X-ACCESS-TOKEN': self.user_valid_token, 'If-None-Match': response.headers['ETag']})
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_get_file_404(self):
+        response = self.client.get('/files/1234', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(data['success'], False)
+
     def test_upload_file_failed_400(self):
         response = self.client.post(
             '/files', data={}, content_type='multipart/form-data', headers={
@@ -229,6 +409,44 @@ class EmployeesTests(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(data['departments'])
 
+    def test_get_departments_expand_success(self):
+        self.client.post('/departments', json=self.new_department, headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+
+        response = self.client.get('/departments?expand=employees', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('employees', data['departments'][0])
+
+    def test_get_departments_not_modified_304(self):
+        self.client.post('/departments', json=self.new_department, headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+
+        response = self.client.get('/departments', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        etag = response.headers['ETag']
+
+        response = self.client.get('/departments', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token, 'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_get_departments_invalidated_after_create(self):
+        response = self.client.get('/departments', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        etag = response.headers['ETag']
+
+        self.client.post('/departments', json=self.new_department, headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+
+        response = self.client.get('/departments', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token, 'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
     # /employees
 
     def test_get_employees_success(self):
@@ -240,6 +458,217 @@ class EmployeesTests(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(data['employees'])
 
+    def test_get_employees_paginated_success(self):
+        response_dpto_tmp = self.client.post(
+            '/departments', json=self.new_department, headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+        data_tmp = json.loads(response_dpto_tmp.data)
+        self.new_employee['selectDepartment'] = str(data_tmp['department']['id'])
+
+        for _ in range(2):
+            self.client.post('/employees', json=self.new_employee, headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+
+        response = self.client.get('/employees?limit=1', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(data['employees']), 1)
+        self.assertTrue(data['next_cursor'])
+
+        response = self.client.get('/employees?limit=1&after={}'.format(data['next_cursor']), headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        next_data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(next_data['employees'][0]['id'], data['employees'][0]['id'])
+
+    def test_get_employees_paginated_failed_400(self):
+        response = self.client.get('/employees?limit=1&after=invalid', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertTrue(data['message'])
+
+    def test_get_employees_expand_success(self):
+        response_dpto_tmp = self.client.post(
+            '/departments', json=self.new_department, headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+        data_tmp = json.loads(response_dpto_tmp.data)
+        self.new_employee['selectDepartment'] = str(data_tmp['department']['id'])
+        response_empl_tmp = self.client.post('/employees', json=self.new_employee, headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        employee_id_tmp = json.loads(response_empl_tmp.data)['id']
+
+        response = self.client.get('/employees?expand=department,files', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+        employee = [employee for employee in data['employees'] if employee['id'] == employee_id_tmp][0]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(employee['department']['id'], self.new_employee['selectDepartment'])
+        self.assertEqual(employee['files'], [])
+
+    def test_get_employees_expand_failed_400(self):
+        response = self.client.get('/employees?expand=salary', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_get_employees_fields_success(self):
+        response = self.client.get('/employees?fields=id,firstname&limit=5', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+        for employee in data['employees']:
+            self.assertEqual(set(employee), {'id', 'firstname'})
+
+    def test_get_employees_fields_failed_400(self):
+        response = self.client.get('/employees?fields=id,salary', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_export_employees_success(self):
+        response_dpto_tmp = self.client.post(
+            '/departments', json=self.new_department, headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+        data_tmp = json.loads(response_dpto_tmp.data)
+        self.new_employee['selectDepartment'] = str(data_tmp['department']['id'])
+        self.client.post('/employees', json=self.new_employee, headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+
+        response = self.client.get('/employees/export?format=ndjson', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        rows = [json.loads(line) for line in response.data.splitlines()]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertTrue(rows)
+        self.assertTrue(rows[0]['id'])
+
+    def test_export_employees_failed_400(self):
+        response = self.client.get('/employees/export?format=xml', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_export_employees_gzip_success(self):
+        response_dpto_tmp = self.client.post(
+            '/departments', json=self.new_department, headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+        data_tmp = json.loads(response_dpto_tmp.data)
+        self.new_employee['selectDepartment'] = str(data_tmp['department']['id'])
+        self.client.post('/employees', json=self.new_employee, headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+
+        response = self.client.get('/employees/export?format=ndjson', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token, 'Accept-Encoding': 'gzip'})
+        rows = [json.loads(line) for line in gzip.decompress(response.data).splitlines()]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertTrue(len(rows) > 0)
+
+    def test_get_employees_identity_success(self):
+        response = self.client.get('/employees', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token, 'Accept-Encoding': 'gzip;q=0'})
+
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+
+    def test_search_employees_success(self):
+        department = {'name': 'Seguridad ' + random_username(8), 'short_name': 'SG'}
+        response_dpto_tmp = self.client.post(
+            '/departments', json=department, headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+        data_tmp = json.loads(response_dpto_tmp.data)
+        self.new_employee['selectDepartment'] = str(data_tmp['department']['id'])
+
+        response_empl_tmp = self.client.post('/employees', json=self.new_employee, headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        employee_id_tmp = json.loads(response_empl_tmp.data)['id']
+
+        response = self.client.get('/employees?search={}'.format(department['name'].split()[1].upper()), headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual([employee['id'] for employee in data['employees']], [employee_id_tmp])
+
+    def test_search_employees_404(self):
+        response = self.client.get('/employees?search={}'.format(random_username(12)), headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(data['success'], False)
+
+    def test_search_employees_paginated_success(self):
+        department = {'name': 'Auditoria ' + random_username(8), 'short_name': 'AU'}
+        response_dpto_tmp = self.client.post(
+            '/departments', json=department, headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+        self.new_employee['selectDepartment'] = json.loads(response_dpto_tmp.data)['department']['id']
+
+        employee_ids = []
+        for _ in range(3):
+            response_empl_tmp = self.client.post('/employees', json=self.new_employee, headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+            employee_ids.append(json.loads(response_empl_tmp.data)['id'])
+
+        url = '/employees?limit=2&search=' + department['name'].split()[1]
+        first = json.loads(self.client.get(url, headers={
+            'X-ACCESS-TOKEN': self.user_valid_token}).data)
+        second = json.loads(self.client.get(url + '&after=' + first['next_cursor'], headers={
+            'X-ACCESS-TOKEN': self.user_valid_token}).data)
+
+        self.assertEqual(len(first['employees']), 2)
+        self.assertEqual(len(second['employees']), 1)
+        self.assertIsNone(second['next_cursor'])
+        self.assertEqual(sorted(employee['id'] for employee in first['employees'] + second['employees']),
+                         sorted(employee_ids))
+
+    def test_search_employees_written_by_other_worker(self):
+        department = {'name': 'Archivo ' + random_username(8), 'short_name': 'AR'}
+        response_dpto_tmp = self.client.post(
+            '/departments', json=department, headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+        dpto_tmp_id = json.loads(response_dpto_tmp.data)['department']['id']
+        url = '/employees?search=' + department['name'].split()[1]
+
+        # loads this process' index
+        response = self.client.get(url, headers={'X-ACCESS-TOKEN': self.user_valid_token})
+        self.assertEqual(response.status_code, 404)
+
+        # another worker's write: no mapper events here, only the version bump
+        with self.app.app_context():
+            with db.engine.begin() as connection:
+                connection.execute(db.insert(Employee).values(
+                    id='other-worker-' + random_username(8), firstname='Bianca', lastname='Aguinaga',
+                    age=16, is_active=True, department_id=dpto_tmp_id, created_at=datetime.utcnow()))
+                search.bump_versions(connection, 'employees')
+        search.employees_index.checked_at = 0
+
+        response = self.client.get(url, headers={'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data['employees']), 1)
+
     def test_update_employee_success(self):
         response_dpto_tmp = self.client.post(
             '/departments', json=self.new_department, headers={
@@ -439,6 +868,56 @@ class EmployeesTests(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(data['success'], True)
 
+    def test_delete_department_with_employees_409(self):
+        dpto_tmp_id, _ = self.create_employees_tmp(1)
+
+        response = self.client.delete('/departments/' + dpto_tmp_id, headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(data['success'], False)
+
+    def test_deleted_department_takes_no_employees_400(self):
+        dpto_tmp_id, employee_ids = self.create_employees_tmp(1)
+        deleted_dpto_id, _ = self.create_employees_tmp(0)
+        self.client.delete('/departments/' + deleted_dpto_id, headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        self.new_employee['selectDepartment'] = deleted_dpto_id
+
+        response = self.client.post('/employees', json=self.new_employee, headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post('/employees/bulk', json=[self.new_employee], headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.data)['errors'][0]['errors'], ['department does not exist'])
+
+        response = self.client.patch('/employees', json={
+            'ids': employee_ids, 'set': {'selectDepartment': deleted_dpto_id}}, headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+        self.assertEqual(response.status_code, 400)
+
+        with open('static/testImages/test.png', 'rb') as file:
+            file_content = file.read()
+        response = self.client.patch('/employees/' + employee_ids[0], data={
+            'age': '77', 'selectDepartment': deleted_dpto_id,
+            'image': (io.BytesIO(file_content), 'test.png')}, headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+        self.assertEqual(response.status_code, 400)
+
+        with self.app.app_context():
+            employee = db.session.get(Employee, employee_ids[0])
+            self.assertEqual((employee.age, employee.department_id, employee.image),
+                             (16, dpto_tmp_id, None))
+            self.assertEqual(employee.files, [])
+
+        response = self.client.get('/employees?limit=500', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        self.assertNotIn(deleted_dpto_id, [employee['department_id'] for employee
+                                           in json.loads(response.data)['employees']])
+
     def test_delete_department_404(self):
         response = self.client.delete('/departments/1234', headers={
             'X-ACCESS-TOKEN': self.user_valid_token})
@@ -498,5 +977,416 @@ class EmployeesTests(unittest.TestCase):
         self.assertEqual(response.status_code, 404)
         self.assertEqual(data['success'], False)
 
+    def test_delete_employee_soft_success(self):
+        _, employee_ids = self.create_employees_tmp(1)
+
+        self.client.delete('/employees/' + employee_ids[0], headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+
+        response_active = self.client.get('/employees', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        response_inactive = self.client.get('/employees?status=inactive', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        active_ids = [e['id'] for e in json.loads(response_active.data).get('employees', [])]
+        inactive = json.loads(response_inactive.data)['employees']
+
+        self.assertNotIn(employee_ids[0], active_ids)
+        self.assertIn(employee_ids[0], [e['id'] for e in inactive])
+        self.assertTrue(all(e['deactivated_at'] for e in inactive))
+
+        response = self.client.delete('/employees/' + employee_ids[0], headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        self.assertEqual(response.status_code, 404)
+
+    def test_get_employees_status_failed_400(self):
+        response = self.client.get('/employees?status=deleted', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_archive_employees_success(self):
+        _, employee_ids = self.create_employees_tmp(1)
+        self.client.delete('/employees/' + employee_ids[0], headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+
+        with self.app.app_context():
+            archive.archive(after_days=0)
+            self.assertIsNone(db.session.get(Employee, employee_ids[0]))
+            self.assertIsNotNone(db.session.get(ArchivedEmployee, employee_ids[0]))
+
+    # /employees (batch)
+
+    def create_employees_tmp(self, count):
+        response_dpto_tmp = self.client.post(
+            '/departments', json=self.new_department, headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+        dpto_tmp_id = json.loads(response_dpto_tmp.data)['department']['id']
+
+        self.new_employee['selectDepartment'] = dpto_tmp_id
+        employee_ids = []
+        for _ in range(count):
+            response_empl_tmp = self.client.post(
+                '/employees', json=self.new_employee, headers={
+                    'X-ACCESS-TOKEN': self.user_valid_token})
+            employee_ids.append(json.loads(response_empl_tmp.data)['id'])
+
+        return dpto_tmp_id, employee_ids
+
+    def test_update_employees_batch_success(self):
+        old_dpto_id, employee_ids = self.create_employees_tmp(2)
+        new_dpto_id, _ = self.create_employees_tmp(0)
+
+        response = self.client.patch('/employees', json={
+            'ids': employee_ids + ['1234'],
+            'set': {'selectDepartment': new_dpto_id, 'is_active': False}}, headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual([result['status'] for result in data['results']], ['updated', 'updated', 'not_found'])
+
+        response_stats = self.client.get('/stats', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        departments = {d['id']: d for d in json.loads(response_stats.data)['departments']}
+        self.assertEqual(departments[old_dpto_id]['employees'], 0)
+        self.assertEqual(departments[new_dpto_id]['employees'], 2)
+        self.assertEqual(departments[new_dpto_id]['inactive_employees'], 2)
+
+    def test_update_employees_batch_filter_success(self):
+        dpto_tmp_id, employee_ids = self.create_employees_tmp(2)
+
+        response = self.client.patch('/employees', json={
+            'filter': {'department': dpto_tmp_id},
+            'set': {'age': 40}}, headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(result['id'] for result in data['results']), sorted(employee_ids))
+
+    def test_update_employees_batch_deleted_department_404(self):
+        dpto_tmp_id, employee_ids = self.create_employees_tmp(1)
+        self.client.delete('/employees/' + employee_ids[0], headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        self.client.delete('/departments/' + dpto_tmp_id, headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+
+        response = self.client.patch('/employees', json={
+            'ids': employee_ids, 'set': {'is_active': True}}, headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(data['results'], [{'id': employee_ids[0], 'status': 'not_found'}])
+        with self.app.app_context():
+            self.assertFalse(db.session.get(Employee, employee_ids[0]).is_active)
+
+    def test_update_employees_batch_age_out_of_range_400(self):
+        _, employee_ids = self.create_employees_tmp(1)
+
+        response = self.client.patch('/employees', json={
+            'ids': employee_ids, 'set': {'age': 2 ** 40}}, headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data['message'], 'age is out of range')
+
+    def test_update_employees_batch_failed_400(self):
+        response = self.client.patch('/employees', json={
+            'ids': ['1234'], 'set': {'firstname': 'Juan'}}, headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_delete_employees_batch_success(self):
+        dpto_tmp_id, employee_ids = self.create_employees_tmp(2)
+
+        response = self.client.delete('/employees', json={'ids': employee_ids}, headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual([result['status'] for result in data['results']], ['deleted', 'deleted'])
+
+        response_employee = self.client.delete('/employees/' + employee_ids[0], headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        self.assertEqual(response_employee.status_code, 404)
+
+    def test_delete_employees_batch_404(self):
+        response = self.client.delete('/employees', json={'ids': ['1234']}, headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(data['results'], [{'id': '1234', 'status': 'not_found'}])
+
+    # /api/signin
+
+    def test_login_success(self):
+        response = self.client.post('/api/signin', json={
+            'username': self.new_authenticated_user['username'],
+            'password': self.new_authenticated_user['password']})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['token'])
+        self.assertEqual(data['user_id'], self.user_created_id)
+
+    def test_login_after_hashing_pool_broke_success(self):
+        # setUp hashed through the pool: kill its processes, as the OOM killer would
+        pool = passwords.get_executor()
+        for process in list(pool._processes.values()):
+            os.kill(process.pid, signal.SIGKILL)
+            process.join()
+
+        response = self.client.post('/api/signin', json={
+            'username': self.new_authenticated_user['username'],
+            'password': self.new_authenticated_user['password']})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNot(passwords.get_executor(), pool)
+
+    def test_login_failed_400(self):
+        response = self.client.post('/api/signin', json={})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertTrue(data['errors'])
+
+    def test_login_failed_401(self):
+        response = self.client.post('/api/signin', json={
+            'username': self.new_authenticated_user['username'],
+            'password': 'wrong-password'})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(data['success'], False)
+
+    # /api/refresh
+
+    def test_refresh_success(self):
+        response = self.client.post('/api/signin', json={
+            'username': self.new_authenticated_user['username'],
+            'password': self.new_authenticated_user['password']})
+        refresh_token = json.loads(response.data)['refresh_token']
+
+        response = self.client.post('/api/refresh', json={'refresh_token': refresh_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['user_id'], self.user_created_id)
+        self.assertNotEqual(data['refresh_token'], refresh_token)
+
+        response = self.client.get('/departments', headers={
+            'X-ACCESS-TOKEN': data['token']})
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post('/api/refresh', json={'refresh_token': refresh_token})
+        self.assertEqual(response.status_code, 401)
+
+    def test_refresh_used_by_other_worker_failed_401(self):
+        response = self.client.post('/api/signin', json={
+            'username': self.new_authenticated_user['username'],
+            'password': self.new_authenticated_user['password']})
+        refresh_token = json.loads(response.data)['refresh_token']
+        payload = jwt.decode(refresh_token, options={'verify_signature': False})
+
+        # another worker refreshed with it; this one has not synced yet
+        with self.app.app_context():
+            with db.engine.begin() as connection:
+                connection.execute(db.insert(RevokedToken.__table__).values(
+                    jti=payload['jti'], expires_at=payload['exp'], revoked_at=int(time.time())))
+
+        response = self.client.post('/api/refresh', json={'refresh_token': refresh_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(data['success'], False)
+
+    def test_refresh_failed_400(self):
+        response = self.client.post('/api/refresh', json={})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_refresh_failed_401(self):
+        response = self.client.post('/api/refresh', json={
+            'refresh_token': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(data['success'], False)
+
+    # /api/signout
+
+    def test_signout_success(self):
+        response = self.client.post('/api/signin', json={
+            'username': self.new_authenticated_user['username'],
+            'password': self.new_authenticated_user['password']})
+        session = json.loads(response.data)
+
+        response = self.client.post('/api/signout', json={
+            'refresh_token': session['refresh_token']}, headers={
+            'X-ACCESS-TOKEN': session['token']})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+
+        response = self.client.get('/departments', headers={
+            'X-ACCESS-TOKEN': session['token']})
+        self.assertEqual(json.loads(response.data)['success'], False)
+
+        response = self.client.post('/api/refresh', json={
+            'refresh_token': session['refresh_token']})
+        self.assertEqual(response.status_code, 401)
+
+    # /api/token-cache
+
+    def test_get_token_cache_stats_success(self):
+        for _ in range(2):
+            self.client.get('/departments', headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+
+        response = self.client.get('/api/token-cache', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['token_cache']['hits'] >= 2)
+
+    # CORS
+
+    def test_preflight_success(self):
+        response = self.client.options('/employees', headers={
+            'Origin': 'http://localhost:8080',
+            'Access-Control-Request-Method': 'POST',
+            'Access-Control-Request-Headers': 'content-type,x-access-token'})
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response.headers['Access-Control-Allow-Origin'], 'http://localhost:8080')
+        self.assertIn('X-ACCESS-TOKEN', response.headers['Access-Control-Allow-Headers'])
+        self.assertTrue(int(response.headers['Access-Control-Max-Age']) > 10)
+
+    def test_preflight_unknown_origin(self):
+        response = self.client.options('/employees', headers={
+            'Origin': 'http://evil.example.com',
+            'Access-Control-Request-Method': 'POST'})
+
+        self.assertEqual(response.status_code, 204)
+        self.assertNotIn('Access-Control-Allow-Origin', response.headers)
+
+    def test_cors_headers_only_for_allowed_origin(self):
+        response = self.client.get('/departments', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token,
+            'Origin': 'http://localhost:8080'})
+        self.assertEqual(response.headers['Access-Control-Allow-Origin'], 'http://localhost:8080')
+
+        response = self.client.get('/departments', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        self.assertNotIn('Access-Control-Allow-Origin', response.headers)
+
+    # /api/pool
+
+    def test_get_pool_stats_success(self):
+        response = self.client.get('/api/pool', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertIn('pools', data)
+
+    # query budgets
+
+    def test_create_department_query_budget_500(self):
+        self.app.view_functions['create_department'].query_budget = 0
+
+        response = self.client.post('/departments', json=self.new_department, headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('Query budget exceeded', data['message'])
+        self.assertTrue(data['repeated_queries'])
+
+    # /stats
+
+    def test_get_stats_success(self):
+        response = self.client.get('/stats', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['stats']['departments'], len(data['departments']))
+        self.assertEqual(data['stats']['employees'], sum(d['employees'] for d in data['departments']))
+
+    def test_get_stats_after_create_employee_success(self):
+        response_dpto_tmp = self.client.post(
+            '/departments', json=self.new_department, headers={
+                'X-ACCESS-TOKEN': self.user_valid_token})
+        dpto_tmp_id = json.loads(response_dpto_tmp.data)['department']['id']
+
+        self.new_employee['selectDepartment'] = dpto_tmp_id
+        self.new_employee['age'] = 30
+        self.client.post('/employees', json=self.new_employee, headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+
+        response = self.client.get('/stats', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        data = json.loads(response.data)
+        department = next(d for d in data['departments'] if d['id'] == dpto_tmp_id)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(department['employees'], 1)
+        self.assertEqual(department['active_employees'], 1)
+        self.assertEqual(department['average_age'], 30)
+
+    # /users
+
+    def test_delete_user_rejects_tokens(self):
+        # cached by authorize from here on
+        response = self.client.get('/departments', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        self.assertEqual(json.loads(response.data)['success'], True)
+
+        response = self.client.delete('/users/{}'.format(self.user_created_id))
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/departments', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+        self.assertEqual(json.loads(response.data)['success'], False)
+
+    def test_delete_user_failed_404(self):
+        response = self.client.delete('/users/{}'.format(random_username(12)))
+        self.assertEqual(response.status_code, 404)
+
+    # /metrics
+
+    def test_get_metrics_success(self):
+        self.client.get('/departments', headers={
+            'X-ACCESS-TOKEN': self.user_valid_token})
+
+        response = self.client.get('/metrics')
+        body = response.data.decode('utf-8')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="/departments"', body)
+        self.assertIn('http_request_db_queries_bucket{route="/departments",le="+Inf"}', body)
+        self.assertIn('authorize_duration_seconds_count', body)
+
     def tearDown(self):
         self.client.delete('/users/{}'.format(self.user_created_id))
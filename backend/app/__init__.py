@@ -2,76 +2,145 @@ from flask import (
     Flask,
     request,
     jsonify,
-    abort
+    abort,
+    Response,
+    stream_with_context,
+    send_file
 )
 from .models import db, setup_db, Employee, Department, File
-from flask_cors import CORS
-from .utilities import allowed_file
+from .utilities import allowed_file, validate_employee, parse_expand, parse_status
 from .users_controller import users_bp
 from .authentication import authorize
-
+from .pagination import is_paginated, parse_page_args, paginate
+from .search import search_employees, search_departments, invalidate_employees_index
+from .bulk import read_csv_rows, validate_rows, insert_employees
+from .batch import parse_target, parse_changes, update_employees, delete_employees
+from .stats import read_stats, rebuild as rebuild_stats
+from .log import setup_logging
+from .pool import pool_stats
+from .cache import response_cache
+from .storage import UploadRequest, commit_blob, blob_folder, blob_path, send_blob
+from .thumbnails import SIZES as THUMBNAIL_SIZES, schedule_derivatives, find_derivative
+from .compression import compress_response
+from .cors import PreflightMiddleware, create_policy
+from .serialization import (EMPLOYEE_FIELDS, DEPARTMENT_FIELDS, parse_fields, project,
+                            rows_as_dicts, pick, dumps, json_response, TimedJSONProvider)
+from . import metrics, profiler, archive
+from .query_audit import query_budget, check_budget
+from . import startup
+from config import config
+
+import click
+import csv
+import io
+import json
 import os
-import sys
+import logging
+import mimetypes
+
+
+logger = logging.getLogger(__name__)
+
+# relations that ?expand= can embed, each loaded with a fixed number of
+# queries instead of one lazy load per row
+EMPLOYEE_EXPANSIONS = {
+    'department': db.joinedload,
+    'files': db.selectinload,
+}
+DEPARTMENT_EXPANSIONS = {
+    # compared explicitly: a bare boolean column cannot be cloned as loader criteria
+    'employees': lambda employees: db.selectinload(employees.and_(Employee.is_active == True)),
+}
+# ?status= of the employee lists: deleted employees are only deactivated, and
+# hidden unless asked for
+EMPLOYEE_STATUSES = {
+    'active': [Employee.is_active],
+    'inactive': [db.not_(Employee.is_active)],
+    'all': [],
+}
+
+
+def employee_list_tags(args):
+    # search also matches department names
+    tags = {'employees'}
+    if 'search' in args or 'department' in args.get('expand', ''):
+        tags.add('departments')
+    if 'files' in args.get('expand', ''):
+        tags.add('files')
+    return tags
+
+
+def department_list_tags(args):
+    tags = {'departments'}
+    if 'employees' in args.get('expand', ''):
+        tags.add('employees')
+    return tags
 
 
 def create_app(test_config=None):
+    setup_logging()
     app = Flask(__name__)
+    app.request_class = UploadRequest
+    app.json = TimedJSONProvider(app)
     with app.app_context():
         app.config['UPLOAD_FOLDER'] = 'static/employees'
+        app.config['BLOB_FOLDER'] = 'static/blobs'
+        app.config['USE_X_SENDFILE'] = config.get('USE_X_SENDFILE', False)
+        app.config['X_ACCEL_REDIRECT_PREFIX'] = config.get('X_ACCEL_REDIRECT_PREFIX', None)
+        app.config['ENFORCE_QUERY_BUDGETS'] = (test_config or {}).get(
+            'enforce_query_budgets', config.get('ENFORCE_QUERY_BUDGETS', False))
         app.register_blueprint(users_bp)
         setup_db(app, test_config['database_path'] if test_config else None)
-        CORS(app, origins=['http://localhost:8080'])
+
+    cors_policy = create_policy()
+    app.wsgi_app = PreflightMiddleware(app.wsgi_app, cors_policy)
+
+    if config.get('ARCHIVE_INTERVAL_SECONDS'):
+        archive.start(app, config['ARCHIVE_INTERVAL_SECONDS'])
+
+    # after_request hooks run in reverse order: the profile and the
+    # request timings also cover the CORS headers and the compression
+    app.before_request(profiler.start)
+    app.before_request(metrics.start_request)
+    app.after_request(profiler.stop)
+    app.after_request(metrics.finish_request)
+    app.after_request(check_budget)
+    app.teardown_request(profiler.discard)
 
     @app.after_request
     def after_request(response):
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-        response.headers.add('Access-Control-Allow-Methods',
-                             'GET,PATCH,POST,DELETE,OPTIONS')
-        response.headers.add('Access-Control-Max-Age', '10')
-        return response
+        cors_policy.apply(response, request.headers.get('Origin'))
+        return compress_response(response)
 
     # Post
     #########################################################
 
     @app.route('/employees', methods=['POST'])
+    @query_budget(6)
     @authorize
     def create_employee():
         returned_code = 201
         list_errors = []
         try:
             body = request.json
+            list_errors = validate_employee(body)
 
-            if 'firstname' not in body:
-                list_errors.append('firstname is required')
-            else:
-                firstname = body.get('firstname')
-
-            if 'lastname' not in body:
-                list_errors.append('lastname is required')
-            else:
-                lastname = body['lastname']
-
-            if 'age' not in body:
-                list_errors.append('age is required')
-            else:
-                age = body['age']
-
-            if 'selectDepartment' not in body:
-                list_errors.append('department is required')
-            else:
-                department_id = body['selectDepartment']
+            if not list_errors and Department.is_deleted(body['selectDepartment']):
+                list_errors.append('department does not exist')
 
             if len(list_errors) > 0:
                 returned_code = 400
             else:
-                employee = Employee(firstname, lastname, age, department_id)
+                employee = Employee(body['firstname'], body['lastname'],
+                                    body['age'], body['selectDepartment'])
                 db.session.add(employee)
                 db.session.commit()
+                response_cache.invalidate('employees')
 
                 employee_id = employee.id
 
         except Exception as e:
-            print(sys.exc_info())
+            logger.exception('Error creating employee')
             db.session.rollback()
             returned_code = 500
 
@@ -85,7 +154,66 @@ def create_app(test_config=None):
         else:
             return jsonify({'id': employee_id, 'success': True, 'message': 'Employee Created successfully!'}), returned_code
 
+    @app.route('/employees/bulk', methods=['POST'])
+    # one INSERT per batch: grows with the upload
+    @query_budget(None)
+    @authorize
+    def create_employees_bulk():
+        returned_code = 201
+        error_message = ''
+        row_errors = []
+        created = []
+        try:
+            batch_size = request.args.get(
+                'batch_size', config.get('BULK_INSERT_BATCH_SIZE', 1000), type=int)
+
+            if 'file' in request.files:
+                rows = read_csv_rows(request.files['file'].stream)
+            elif request.mimetype == 'text/csv':
+                rows = read_csv_rows(io.BytesIO(request.get_data()))
+            else:
+                rows = request.get_json(silent=True)
+
+            if not isinstance(rows, list) or not rows:
+                returned_code = 400
+                error_message = 'A JSON array or a CSV file of employees is required'
+            elif batch_size < 1:
+                returned_code = 400
+                error_message = 'batch_size must be a positive integer'
+            else:
+                valid_rows, row_errors = validate_rows(rows)
+
+                if not valid_rows:
+                    returned_code = 400
+                    error_message = 'No valid employees to import'
+                else:
+                    created = insert_employees(valid_rows, batch_size)
+                    db.session.commit()
+                    response_cache.invalidate('employees')
+                    invalidate_employees_index()
+
+        except (UnicodeDecodeError, csv.Error):
+            returned_code = 400
+            error_message = 'Invalid CSV file'
+
+        except Exception as e:
+            logger.exception('Error importing employees')
+            db.session.rollback()
+            returned_code = 500
+
+        finally:
+            db.session.close()
+
+        if returned_code == 400:
+            return jsonify({'success': False, 'message': error_message, 'errors': row_errors}), returned_code
+        elif returned_code != 201:
+            abort(returned_code)
+        else:
+            return jsonify({'success': True, 'created': created, 'errors': row_errors,
+                            'message': '{} employees imported'.format(len(created))}), returned_code
+
     @app.route('/files', methods=['POST'])
+    @query_budget(4)
     @authorize
     def upload_image():
         returned_code = 201
@@ -107,23 +235,20 @@ def create_app(test_config=None):
             if len(list_errors) > 0:
                 returned_code = 400
             else:
+                # the blob is stored before the row that points to it
+                content_hash, size = commit_blob(file)
+                schedule_derivatives(blob_folder(), content_hash)
 
-                cwd = os.getcwd()
-
-                employee_dir = os.path.join(
-                    app.config['UPLOAD_FOLDER'], employee_id)
-                os.makedirs(employee_dir, exist_ok=True)
-
-                upload_folder = os.path.join(cwd, employee_dir)
-
-                file.save(os.path.join(upload_folder, file.filename))
-
-                file = File(file.filename, employee_id)
+                file = File(file.filename, employee_id, content_hash, size)
 
                 db.session.add(file)
                 db.session.commit()
+                response_cache.invalidate('files')
+
+                file_data = file.serialize()
 
         except Exception as e:
+            logger.exception('Error uploading file')
             db.session.rollback()
             returned_code = 500
         finally:
@@ -134,9 +259,10 @@ def create_app(test_config=None):
         elif returned_code != 201:
             abort(returned_code)
         else:
-            return jsonify({'success': True, 'message': 'File uploaded successfully!'}), returned_code
+            return jsonify({'success': True, 'file': file_data, 'message': 'File uploaded successfully!'}), returned_code
 
     @app.route('/departments', methods=['POST'])
+    @query_budget(4)
     @authorize
     def create_department():
         returned_code = 201
@@ -160,12 +286,12 @@ def create_app(test_config=None):
                 department = Department(name, short_name)
                 db.session.add(department)
                 db.session.commit()
+                response_cache.invalidate('departments')
 
                 department_id = department.id
 
         except Exception as e:
-            print('error: ', e)
-            print('exc_info: ', sys.exc_info())
+            logger.exception('Error creating department')
             db.session.rollback()
             returned_code = 500
 
@@ -183,51 +309,233 @@ def create_app(test_config=None):
     #######################################################################################
 
     @app.route('/employees', methods=['GET'])
+    @query_budget(4)
     @authorize
+    @response_cache.cached(employee_list_tags)
     def get_employees():
         returned_code = 200
         error_message = ''
         employee_list = []
+        next_cursor = None
+        paginated = is_paginated(request.args)
 
         try:
+            expand = parse_expand(request.args, EMPLOYEE_EXPANSIONS)
+            fields = parse_fields(request.args, EMPLOYEE_FIELDS)
+            status = parse_status(request.args, EMPLOYEE_STATUSES)
+            keys = [Employee.created_at, Employee.id]
+
             search_query = request.args.get('search', None)
             if search_query:
-                employees = Employee.query.filter(
-                    Employee.firstname.like('%{}%'.format(search_query))).all()
-
-                employees_list = [employee.serialize()
-                                  for employee in employees]
+                employees, ranking, matches = search_employees(search_query)
+            else:
+                employees, ranking, matches = Employee.query, [], None
+            employees = employees.filter(*EMPLOYEE_STATUSES[status])
 
+            if expand:
+                employees = employees.options(
+                    *[EMPLOYEE_EXPANSIONS[relation](getattr(Employee, relation))
+                      for relation in expand])
+            else:
+                # plain rows of the requested columns, no ORM objects
+                employees = employees.with_entities(*project(Employee, fields, keys))
+
+            # index hits are ranked and paged in Python, then fetched by id
+            if paginated:
+                limit, after = parse_page_args(request.args)
+                if matches is not None:
+                    employees, next_cursor = matches.page(employees, keys, limit, after)
+                else:
+                    employees, next_cursor = paginate(employees, keys, limit, after)
+            elif matches is not None:
+                employees = matches.all(employees)
             else:
-                employees = Employee.query.all()
-                employee_list = [employee.serialize()
-                                 for employee in employees]
+                employees = employees.order_by(*ranking).all()
+
+            with metrics.timed_serialization():
+                if expand:
+                    employee_list = [pick(employee.serialize(expand), fields, expand)
+                                     for employee in employees]
+                else:
+                    employee_list = rows_as_dicts(employees, fields)
 
             if not employee_list:
                 returned_code = 404
                 error_message = 'No employees found'
 
-        except Exception as e:
+        except ValueError as e:
+            returned_code = 400
+            error_message = str(e)
 
-            # print(sys.exc_info())
+        except Exception as e:
+            logger.exception('Error retrieving employees')
             returned_code = 500
             error_message = 'Error retrieving employees'
 
         if returned_code != 200:
             return jsonify({'success': False, 'message': error_message}), returned_code
 
-        return jsonify({'success': True, 'employees': employee_list}), returned_code
+        response = {'success': True, 'employees': employee_list}
+        if paginated:
+            response['next_cursor'] = next_cursor
+
+        return json_response(response, returned_code)
+
+    @app.route('/employees/export', methods=['GET'])
+    @query_budget(2)
+    @authorize
+    def export_employees():
+        export_format = request.args.get('format', 'ndjson')
+
+        if export_format != 'ndjson':
+            return jsonify({'success': False, 'message': 'Export format not supported'}), 400
+
+        try:
+            fields = parse_fields(request.args, EMPLOYEE_FIELDS)
+            status = parse_status(request.args, EMPLOYEE_STATUSES)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+
+        def generate():
+            try:
+                # yield_per streams rows through a server-side cursor instead
+                # of loading the whole table before the first byte is sent
+                employees = db.session.execute(
+                    db.select(*project(Employee, fields))
+                    .where(*EMPLOYEE_STATUSES[status])
+                    .order_by(Employee.created_at, Employee.id)
+                    .execution_options(yield_per=config.get('EXPORT_BATCH_SIZE', 1000)))
+
+                for employee in employees:
+                    yield dumps(dict(zip(fields, employee))) + b'\n'
+            finally:
+                db.session.close()
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    @app.route('/employees/<employee_id>/image', methods=['GET'])
+    @query_budget(3)
+    @authorize
+    def get_employee_image(employee_id):
+        size = request.args.get('size', None)
+        if size is not None and (not size.isdigit() or int(size) not in THUMBNAIL_SIZES):
+            return jsonify({'success': False, 'message': 'size must be one of: {}'.format(
+                ', '.join(map(str, THUMBNAIL_SIZES)))}), 400
+
+        employee = Employee.query.filter_by(id=employee_id).first()
+        if employee is None:
+            abort(404)
+
+        files = File.query.filter_by(employee_id=employee.id)
+        if employee.image:
+            files = files.filter_by(filename=employee.image)
+        image = files.order_by(File.created_at.desc()).first()
+        db.session.close()
+
+        if image is None:
+            abort(404)
+
+        if image.content_hash is None:
+            # uploaded before the blob storage existed
+            path = os.path.join(os.path.abspath(app.config['UPLOAD_FOLDER']), employee.id, image.filename)
+            if not os.path.exists(path):
+                abort(404)
+            return send_file(path, max_age=0)
+
+        path, mimetype = blob_path(image.content_hash), mimetypes.guess_type(image.filename)[0]
+        max_age = config.get('IMAGE_MAX_AGE', 86400)
+
+        if size is not None:
+            accept_webp = 'image/webp' in request.headers.get('Accept', '')
+            derivative = find_derivative(blob_folder(), image.content_hash, int(size), accept_webp)
+            if derivative is None:
+                # not generated yet, serve the original without caching it
+                schedule_derivatives(blob_folder(), image.content_hash)
+                max_age = 0
+            else:
+                path, mimetype = derivative
+
+        response = send_blob(path, mimetype, '{}-{}-{}'.format(
+            image.content_hash, size or 'original', mimetype.split('/')[-1]), max_age)
+        response.vary.add('Accept')
+        return response
+
+    @app.route('/files/<file_id>', methods=['GET'])
+    @query_budget(2)
+    @authorize
+    def get_file(file_id):
+        file = File.query.filter_by(id=file_id).first()
+        db.session.close()
+
+        if file is None:
+            abort(404)
+
+        mimetype = mimetypes.guess_type(file.filename)[0] or 'application/octet-stream'
+
+        if file.content_hash is None:
+            path = os.path.join(os.path.abspath(app.config['UPLOAD_FOLDER']), file.employee_id, file.filename)
+            if not os.path.exists(path):
+                abort(404)
+            return send_file(path, mimetype=mimetype, max_age=0, conditional=True)
+
+        # a file row always points to the same blob, so its hash is a strong
+        # validator and the response never goes stale
+        return send_blob(blob_path(file.content_hash), mimetype, file.content_hash,
+                         config.get('FILE_MAX_AGE', 31536000))
 
     # PATCH
     ###########################################################################################
 
+    @app.route('/employees', methods=['PATCH'])
+    @query_budget(6)
+    @authorize
+    def update_employees_batch():
+        returned_code = 200
+        error_message = ''
+        results = []
+        try:
+            body = request.get_json(silent=True)
+            ids, conditions = parse_target(body)
+            values = parse_changes(body)
+
+            results, updated = update_employees(ids, conditions, values)
+            if updated:
+                db.session.commit()
+                response_cache.invalidate('employees')
+                invalidate_employees_index()
+            else:
+                returned_code = 404
+                error_message = 'No employees found'
+
+        except ValueError as e:
+            db.session.rollback()
+            returned_code = 400
+            error_message = str(e)
+
+        except Exception as e:
+            logger.exception('Error updating employees')
+            db.session.rollback()
+            returned_code = 500
+
+        finally:
+            db.session.close()
+
+        if returned_code in (400, 404):
+            return jsonify({'success': False, 'message': error_message, 'results': results}), returned_code
+        elif returned_code != 200:
+            abort(returned_code)
+        else:
+            return jsonify({'success': True, 'results': results,
+                            'message': '{} employees updated'.format(updated)}), returned_code
+
     @app.route('/departments/<department_id>', methods=['PATCH'])
+    @query_budget(3)
     @authorize
     def update_department(department_id):
         returned_code = 200
 
         try:
-            department = Department.query.filter_by(id=department_id).first()
+            department = Department.query.filter_by(id=department_id, is_active=True).first()
 
             if not department:
                 returned_code = 404
@@ -241,9 +549,10 @@ def create_app(test_config=None):
                     department.short_name = body['short_name']
 
                 db.session.commit()
+                response_cache.invalidate('departments')
 
         except Exception as e:
-            print(sys.exc_info())
+            logger.exception('Error updating department')
             db.session.rollback()
             returned_code = 500
 
@@ -258,51 +567,103 @@ def create_app(test_config=None):
     # DELETE
     ########################################################################################
 
+    @app.route('/employees', methods=['DELETE'])
+    @query_budget(6)
+    @authorize
+    def delete_employees_batch():
+        returned_code = 200
+        error_message = ''
+        results = []
+        try:
+            ids, conditions = parse_target(request.get_json(silent=True))
+
+            results, deleted = delete_employees(ids, conditions)
+            if deleted:
+                db.session.commit()
+                response_cache.invalidate('employees')
+                invalidate_employees_index()
+            else:
+                returned_code = 404
+                error_message = 'No employees found'
+
+        except ValueError as e:
+            db.session.rollback()
+            returned_code = 400
+            error_message = str(e)
+
+        except Exception as e:
+            logger.exception('Error deleting employees')
+            db.session.rollback()
+            returned_code = 500
+
+        finally:
+            db.session.close()
+
+        if returned_code in (400, 404):
+            return jsonify({'success': False, 'message': error_message, 'results': results}), returned_code
+        elif returned_code != 200:
+            abort(returned_code)
+        else:
+            return jsonify({'success': True, 'results': results,
+                            'message': '{} employees deleted'.format(deleted)}), returned_code
+
     @app.route('/departments/<department_id>', methods=['DELETE'])
+    @query_budget(4)
     @authorize
     def delete_department(department_id):
         returned_code = 200
         try:
-            department = Department.query.get(department_id)
+            # locked so no employee is added or moved in between the checks
+            department = Department.query.filter_by(id=department_id, is_active=True).with_for_update().first()
 
             if not department:
                 returned_code = 404
+            elif db.session.execute(
+                    db.select(Employee.id).where(Employee.department_id == department_id, Employee.is_active)
+                    .limit(1)).first() is not None:
+                returned_code = 409
             else:
-                db.session.delete(department)
+                # soft delete: its deactivated employees still reference it
+                department.is_active = False
                 db.session.commit()
+                response_cache.invalidate('departments')
 
         except Exception as e:
-
-            # print(sys.exc_info())
+            logger.exception('Error deleting department')
             db.session.rollback()
             returned_code = 500
 
         finally:
             db.session.close()
 
-        if returned_code != 200:
+        if returned_code == 409:
+            return jsonify({'success': False,
+                            'message': 'Department has active employees, move or delete them first'}), returned_code
+        elif returned_code != 200:
             abort(returned_code)
 
         return jsonify({'success': True, 'message': 'Department deleted successfully'}), returned_code
 
     @app.route('/employees/<employee_id>', methods=['DELETE'])
+    @query_budget(4)
     @authorize
     def delete_employee(employee_id):
         returned_code = 200
         error_message = ''
 
         try:
-            employee = Employee.query.filter_by(id=employee_id).first()
+            employee = Employee.query.filter_by(id=employee_id, is_active=True).first()
 
             if not employee:
                 returned_code = 404
             else:
-                db.session.delete(employee)
+                # soft delete: the archiver moves the row out later
+                employee.deactivate()
                 db.session.commit()
+                response_cache.invalidate('employees')
 
         except Exception as e:
-
-            # print(sys.exc_info())
+            logger.exception('Error deleting employee')
             db.session.rollback()
             returned_code = 500
 
@@ -315,6 +676,7 @@ def create_app(test_config=None):
         return jsonify({'success': True, 'message': 'Employee deleted successfully'}), returned_code
 
     @app.route('/employees/<employee_id>', methods=['PATCH'])
+    @query_budget(11)
     @authorize
     def update_employee(employee_id):
         returned_code = 200
@@ -328,15 +690,15 @@ def create_app(test_config=None):
             else:
                 body = request.form
 
+                # everything is checked before the employee or the blobs change
                 if 'age' not in body:
                     list_errors.append('age is required')
-                else:
-                    employee.age = request.form['age']
 
                 if 'selectDepartment' not in body:
                     list_errors.append('selectDepartment is required')
-                else:
-                    employee.department_id = request.form['selectDepartment']
+                elif body['selectDepartment'] != employee.department_id \
+                        and Department.is_deleted(body['selectDepartment']):
+                    list_errors.append('department does not exist')
 
                 if 'image' not in request.files:
                     list_errors.append('image is required')
@@ -349,21 +711,21 @@ def create_app(test_config=None):
                     if not allowed_file(file.filename):
                         return jsonify({'success': False, 'message': 'Image format not allowed'}), 400
 
-                    cwd = os.getcwd()
-
-                    employee_dir = os.path.join(
-                        app.config['UPLOAD_FOLDER'], employee.id)
-                    os.makedirs(employee_dir, exist_ok=True)
-
-                    upload_folder = os.path.join(cwd, employee_dir)
+                if list_errors:
+                    db.session.rollback()
+                else:
+                    employee.age = body['age']
+                    employee.department_id = body['selectDepartment']
 
-                    file.save(os.path.join(upload_folder, file.filename))
+                    content_hash, size = commit_blob(file)
+                    schedule_derivatives(blob_folder(), content_hash)
 
+                    db.session.add(File(file.filename, employee.id, content_hash, size))
                     employee.image = file.filename
                     db.session.commit()
+                    response_cache.invalidate('employees')
         except Exception as e:
-
-            # print(sys.exc_info())
+            logger.exception('Error updating employee')
             db.session.rollback()
             returned_code = 500
         finally:
@@ -377,39 +739,127 @@ def create_app(test_config=None):
             return jsonify({'success': True, 'message': 'Employee updated successfully!'}), returned_code
 
     @app.route('/departments', methods=['GET'])
+    @query_budget(4)
     @authorize
+    @response_cache.cached(department_list_tags)
     def get_departments():
         returned_code = 200
+        error_message = ''
         department_list = []
+        next_cursor = None
+        paginated = is_paginated(request.args)
 
         try:
+            expand = parse_expand(request.args, DEPARTMENT_EXPANSIONS)
+            fields = parse_fields(request.args, DEPARTMENT_FIELDS)
+            keys = [Department.name, Department.id]
+
             search_query = request.args.get('search', None)
             if search_query:
-                departments = Department.query.filter(
-                    db.or_(
-                        Department.name.like(f'%{search_query}%'),
-                        Department.short_name.like(f'%{search_query}%')
-                    )
-                ).all()
-                department_list = [department.serialize()
-                                   for department in departments]
+                departments, ranking, matches = search_departments(search_query)
+            else:
+                departments, ranking, matches = Department.query, [Department.name], None
+            departments = departments.filter(Department.is_active)
+
+            if expand:
+                departments = departments.options(
+                    *[DEPARTMENT_EXPANSIONS[relation](getattr(Department, relation))
+                      for relation in expand])
             else:
-                departments = Department.query.order_by(Department.name).all()
-                department_list = [department.serialize()
-                                   for department in departments]
+                departments = departments.with_entities(*project(Department, fields, keys))
+
+            if paginated:
+                limit, after = parse_page_args(request.args)
+                if matches is not None:
+                    departments, next_cursor = matches.page(departments, keys, limit, after)
+                else:
+                    departments, next_cursor = paginate(departments, keys, limit, after)
+            elif matches is not None:
+                departments = matches.all(departments)
+            else:
+                departments = departments.order_by(*ranking).all()
+
+            with metrics.timed_serialization():
+                if expand:
+                    department_list = [pick(department.serialize(expand), fields, expand)
+                                       for department in departments]
+                else:
+                    department_list = rows_as_dicts(departments, fields)
 
             if not department_list:
                 returned_code = 404
 
-        except Exception as e:
+        except ValueError as e:
+            returned_code = 400
+            error_message = str(e)
 
-            # print(sys.exc_info())
+        except Exception as e:
+            logger.exception('Error retrieving departments')
             returned_code = 500
 
-        if returned_code != 200:
+        if returned_code == 400:
+            return jsonify({'success': False, 'message': error_message}), returned_code
+        elif returned_code != 200:
             abort(returned_code)
 
-        return jsonify({'success': True, 'departments': department_list}), returned_code
+        response = {'success': True, 'departments': department_list}
+        if paginated:
+            response['next_cursor'] = next_cursor
+
+        return json_response(response, returned_code)
+
+    @app.route('/stats', methods=['GET'])
+    @query_budget(2)
+    @authorize
+    @response_cache.cached(lambda args: {'employees', 'departments', 'files'})
+    def get_stats():
+        try:
+            totals, departments = read_stats()
+        except Exception as e:
+            logger.exception('Error reading stats')
+            abort(500)
+        finally:
+            db.session.close()
+
+        return json_response({'success': True, 'stats': totals, 'departments': departments}, 200)
+
+    @app.route('/api/pool', methods=['GET'])
+    @query_budget(0)
+    @authorize
+    def get_pool_stats():
+        return jsonify({'success': True, 'pools': pool_stats(db.engines)}), 200
+
+    @app.route('/metrics', methods=['GET'])
+    @query_budget(0)
+    def get_metrics():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    # Commands
+    #########################################################
+
+    @app.cli.command('startup-time')
+    @click.option('--runs', default=5, help='cold starts to measure')
+    @click.option('--database', default=None, help='database URI, defaults to DATABASE_URI')
+    def startup_time(runs, database):
+        """Measure how long a worker takes to import the app, run
+        create_app and serve its first request."""
+        click.echo(json.dumps(startup.run(runs, database), indent=2))
+
+    @app.cli.command('rebuild-stats')
+    def rebuild_stats_command():
+        """Recompute the department stats from the employees and files
+        tables."""
+        with db.engine.begin() as connection:
+            rebuild_stats(connection)
+        click.echo('Department stats rebuilt')
+
+    @app.cli.command('archive-employees')
+    @click.option('--days', default=archive.AFTER_DAYS, help='archive employees deactivated this long ago')
+    @click.option('--batch-size', default=archive.BATCH_SIZE, help='employees moved per transaction')
+    def archive_employees(days, batch_size):
+        """Move long deactivated employees and their files to the archive
+        tables."""
+        click.echo('{} employees archived'.format(archive.archive(days, batch_size)))
 
     @app.errorhandler(405)
     def method_not_allowed(error):
@@ -425,6 +875,13 @@ def create_app(test_config=None):
             'message': 'Resource not found'
         }), 404
 
+    @app.errorhandler(503)
+    def service_unavailable(error):
+        return jsonify({
+            'success': False,
+            'message': 'Service unavailable, try again later'
+        }), 503
+
     @app.errorhandler(500)
     def internal_server_error(error):
         return jsonify({
@@ -0,0 +1,115 @@
+"""Moves long deactivated employees out of the hot tables.
+
+Deleting an employee only deactivates it. Employees deactivated more than
+ARCHIVE_AFTER_DAYS ago are copied, with their file records, into
+employees_archive and files_archive, then deleted from employees and files.
+Each batch of ARCHIVE_BATCH_SIZE employees is its own transaction, so locks
+stay short. On Postgres the batch is picked with FOR UPDATE SKIP LOCKED, so
+several workers archiving at once do not wait on each other. Run it from
+cron with `flask archive-employees`, or set ARCHIVE_INTERVAL_SECONDS to run
+it in a background thread of every worker.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from config import config
+from .models import db, Employee, File, ArchivedEmployee, ArchivedFile
+from .stats import apply_employee_deltas
+from .search import invalidate_employees_index, bump_versions
+from .cache import response_cache
+
+
+logger = logging.getLogger(__name__)
+
+AFTER_DAYS = config.get('ARCHIVE_AFTER_DAYS', 90)
+BATCH_SIZE = config.get('ARCHIVE_BATCH_SIZE', 500)
+
+# the background thread of this process, started once by start()
+archiver = None
+archiver_lock = threading.Lock()
+
+
+def move(connection, source, target, condition, archived_at):
+    columns = [column.name for column in source.columns]
+    connection.execute(db.insert(target).from_select(
+        columns + ['archived_at'],
+        db.select(*source.columns, db.literal(archived_at, db.DateTime(timezone=True))).where(condition)))
+    connection.execute(db.delete(source).where(condition))
+
+
+def archive_batch(connection, cutoff, batch_size):
+    """Archives up to `batch_size` employees deactivated before `cutoff` and
+    returns how many it archived."""
+    employees = Employee.__table__
+    files = File.__table__
+    rows = connection.execute(
+        db.select(employees.c.id, employees.c.department_id, employees.c.is_active, employees.c.age)
+        .where(db.not_(employees.c.is_active), employees.c.deactivated_at < cutoff)
+        .order_by(employees.c.deactivated_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)).mappings().all()
+    if not rows:
+        return 0
+
+    ids = [row['id'] for row in rows]
+    file_counts = dict(connection.execute(
+        db.select(files.c.employee_id, db.func.count(files.c.id))
+        .where(files.c.employee_id.in_(ids)).group_by(files.c.employee_id)).all())
+
+    archived_at = datetime.utcnow()
+    move(connection, files, ArchivedFile.__table__, files.c.employee_id.in_(ids), archived_at)
+    move(connection, employees, ArchivedEmployee.__table__, employees.c.id.in_(ids), archived_at)
+
+    apply_employee_deltas(connection, [dict(row, files=file_counts.get(row['id'], 0)) for row in rows], sign=-1)
+    bump_versions(connection, 'employees')
+    return len(rows)
+
+
+def archive(after_days=AFTER_DAYS, batch_size=BATCH_SIZE):
+    """Archives batches until none is left and returns how many employees
+    were archived. Must run inside an app context."""
+    cutoff = datetime.utcnow() - timedelta(days=after_days)
+    total = 0
+    while True:
+        with db.engine.begin() as connection:
+            archived = archive_batch(connection, cutoff, batch_size)
+        total += archived
+        if archived < batch_size:
+            break
+
+    if total:
+        response_cache.invalidate('employees', 'files')
+        invalidate_employees_index()
+        logger.info('Archived %s employees deactivated before %s', total, cutoff)
+    return total
+
+
+class Archiver:
+    """Runs archive() every `interval` seconds in a daemon thread."""
+
+    def __init__(self, app, interval):
+        self.app = app
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='archiver', daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                with self.app.app_context():
+                    archive()
+            except Exception:
+                logger.exception('Error archiving employees')
+
+    def stop(self):
+        self.stopped.set()
+
+
+def start(app, interval):
+    global archiver
+    with archiver_lock:
+        if archiver is None:
+            archiver = Archiver(app, interval)
+            archiver.thread.start()
+    return archiver
@@ -1,39 +1,245 @@
 from flask import (
     request,
-    jsonify
+    jsonify,
+    g
 )
 
-import sys
+import time
+import logging
+import threading
 import jwt
-from config.local import config
+from collections import OrderedDict
+from sqlalchemy.exc import IntegrityError
+from config import config
+from .models import db, RevokedToken, DeletedUser
+from .metrics import authorize_seconds
 
 from functools import wraps
 
-def authorize(f):
-    @wraps(f)
-    def decorator(*args, **kwargs):
-        token = None
-        print('authentication token: ', request.headers['X-ACCESS-TOKEN'])
-        if 'X-ACCESS-TOKEN' in request.headers:
-            token = request.headers['X-ACCESS-TOKEN']
 
-        if token is None:
-            return jsonify({
-                'success': False,
-                'message': 'Unauthenticated user, please provide your credentials'
-            }), 401
-        
+logger = logging.getLogger(__name__)
+
+
+class TokenCache:
+    """Bounded LRU of already verified tokens. Entries expire at the token's
+    own `exp` claim, so a cached token is never accepted after jwt.decode
+    would have rejected it."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.tokens = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token):
+        with self.lock:
+            entry = self.tokens.get(token)
+            if entry is not None:
+                payload, expires_at = entry
+                if expires_at > time.time():
+                    self.tokens.move_to_end(token)
+                    self.hits += 1
+                    return payload
+                del self.tokens[token]
+
+            self.misses += 1
+            return None
+
+    def set(self, token, payload):
+        if 'exp' not in payload:
+            return
+
+        with self.lock:
+            self.tokens[token] = (payload, payload['exp'])
+            self.tokens.move_to_end(token)
+            while len(self.tokens) > self.maxsize:
+                self.tokens.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        with self.lock:
+            for token in [token for token, (payload, _) in self.tokens.items()
+                          if payload.get('user_created_id') == user_id]:
+                del self.tokens[token]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self.tokens),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+class RevocationStore:
+    """Ids (`jti`) of signed out tokens and ids of deleted users, checked on
+    every request.
+
+    Lookups are a dict access. The `revoked_tokens` and `deleted_users`
+    tables are the shared copy between workers: every `sync_seconds` the rows
+    added since the last sync are pulled in, and rows and entries whose
+    tokens have expired are dropped, since jwt.decode rejects those tokens by
+    itself."""
+
+    def __init__(self, sync_seconds):
+        self.sync_seconds = sync_seconds
+        self.lock = threading.Lock()
+        self.revoked = {}
+        self.deleted_users = {}
+        self.synced_at = None
+
+    def is_revoked(self, jti):
+        if jti is None:
+            return False
+
+        self.sync_if_due()
+        return jti in self.revoked
+
+    def is_user_deleted(self, user_id):
+        if user_id is None:
+            return False
+
+        self.sync_if_due()
+        return user_id in self.deleted_users
+
+    def revoke(self, jti, expires_at):
+        """Revokes `jti`. Returns whether this call did it: the insert into
+        the primary key is atomic across workers, so for a given token only
+        one caller ever gets True."""
+        now = int(time.time())
+        with self.lock:
+            if jti in self.revoked:
+                return False
+            self.revoked[jti] = expires_at
+
         try:
-            jwt.decode(token, config['SECRET_KEY'], config['ALGORYTHM'])
-            #print('\tdecode token: ', data)
+            with db.engine.begin() as connection:
+                connection.execute(db.insert(RevokedToken.__table__).values(
+                    jti=jti, expires_at=expires_at, revoked_at=now))
+        except IntegrityError:
+            return False
+        except Exception:
+            with self.lock:
+                self.revoked.pop(jti, None)
+            raise
+
+        return True
+
+    def delete_user(self, user_id, expires_at):
+        """Rejects every token of `user_id` until `expires_at`, the latest a
+        token issued to them can expire. Called before the user row is
+        deleted, so a failure leaves the user with no usable token rather
+        than deleted with working ones."""
+        with db.engine.begin() as connection:
+            connection.execute(db.insert(DeletedUser.__table__).values(
+                user_id=user_id, expires_at=expires_at, deleted_at=int(time.time())))
+        with self.lock:
+            self.deleted_users[user_id] = expires_at
+
+    def sync_if_due(self):
+        if self.synced_at is None or time.time() - self.synced_at >= self.sync_seconds:
+            self.sync()
+
+    def sync(self):
+        now = time.time()
+        with self.lock:
+            if self.synced_at is not None and now - self.synced_at < self.sync_seconds:
+                return
+            since = None if self.synced_at is None else int(self.synced_at - self.sync_seconds)
+            self.synced_at = now
+
+        try:
+            with db.engine.begin() as connection:
+                connection = connection.execution_options(audit=False)
+                revoked = self.pull(connection, RevokedToken.__table__.c.jti,
+                                    RevokedToken.__table__.c.revoked_at, now, since)
+                deleted_users = self.pull(connection, DeletedUser.__table__.c.user_id,
+                                          DeletedUser.__table__.c.deleted_at, now, since)
+        except Exception:
+            logger.exception('Error syncing revoked tokens')
+            return
+
+        with self.lock:
+            for entries, rows in ((self.revoked, revoked), (self.deleted_users, deleted_users)):
+                for key in [key for key, expires_at in entries.items() if expires_at <= now]:
+                    del entries[key]
+                entries.update(rows)
+
+    @staticmethod
+    def pull(connection, key, added_at, now, since):
+        """Deletes the expired rows of `key`'s table and returns the
+        others added since `since` (all of them when it is None)."""
+        table = key.table
+        connection.execute(db.delete(table).where(table.c.expires_at <= now))
+        query = db.select(key, table.c.expires_at).where(table.c.expires_at > now)
+        if since is not None:
+            # The overlap covers rows other workers committed while we synced.
+            query = query.where(added_at >= since)
+        return connection.execute(query).all()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self.revoked),
+                'deleted_users': len(self.deleted_users),
+                'synced_at': self.synced_at,
+            }
+
+
+token_cache = TokenCache(config.get('TOKEN_CACHE_SIZE', 1024))
+revocations = RevocationStore(config.get('REVOCATION_SYNC_SECONDS', 30))
+
+
+def check_token():
+    """The verified payload of the request's token and None, or None and
+    the response rejecting the request."""
+    token = None
+    if 'X-ACCESS-TOKEN' in request.headers:
+        token = request.headers['X-ACCESS-TOKEN']
+
+    if token is None:
+        return None, (jsonify({
+            'success': False,
+            'message': 'Unauthenticated user, please provide your credentials'
+        }), 401)
+
+    data = token_cache.get(token)
+    if data is None:
+        try:
+            data = jwt.decode(token, config['SECRET_KEY'], config['ALGORYTHM'])
         except Exception as e:
-            print('e: ', e)
-            print('sys.exc_info(): ', sys.exc_info())
-            return jsonify({
+            logger.info('Rejected token: %s', e)
+            return None, jsonify({
                 'success': False,
                 'message': 'Invalid Token, try a new token'
             })
-        
+
+        token_cache.set(token, data)
+
+    # checked on cache hits too: a token is cached until its own expiry
+    if (data.get('type') == 'refresh' or revocations.is_revoked(data.get('jti'))
+            or revocations.is_user_deleted(data.get('user_created_id'))):
+        logger.info('Rejected token: refresh, revoked or of a deleted user')
+        return None, jsonify({
+            'success': False,
+            'message': 'Invalid Token, try a new token'
+        })
+
+    return data, None
+
+
+def authorize(f):
+    @wraps(f)
+    def decorator(*args, **kwargs):
+        started = time.perf_counter()
+        data, rejection = check_token()
+        authorize_seconds.observe(time.perf_counter() - started)
+
+        if rejection is not None:
+            return rejection
+
+        g.token = data
         return f(*args, **kwargs)
     decorator.__name__ = f.__name__
     return decorator
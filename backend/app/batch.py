@@ -0,0 +1,161 @@
+"""Set-based updates and deletes of many employees.
+
+The target is a list of ids or a filter. The matching rows are read once
+(locked with FOR UPDATE where the database supports it) and changed with a
+single UPDATE inside the caller's transaction, so a reorganization is one
+round-trip whatever its size. Deleting is deactivating, as for a single
+employee. The rows read first give the per-id outcomes and the department
+stats deltas, which Core statements do not get from the mapper events.
+"""
+from datetime import datetime
+
+from config import config
+from .models import db, Employee, Department, File
+from .stats import apply_employee_changes
+from .search import bump_versions
+from .bulk import AGE_RANGE
+
+
+BATCH_LIMIT = config.get('EMPLOYEE_BATCH_LIMIT', 10000)
+
+# request field -> column, with the conversion applied to its value
+UPDATABLE_FIELDS = {
+    'selectDepartment': ('department_id', str),
+    'age': ('age', int),
+    'is_active': ('is_active', None),
+}
+FILTERS = {
+    'department': lambda value: Employee.department_id == str(value),
+    'is_active': lambda value: Employee.is_active == value,
+}
+
+
+def parse_target(body):
+    """Returns the ids (None when selecting by filter) and the WHERE clauses
+    of the employees a batch applies to."""
+    if not isinstance(body, dict) or ('ids' in body) == ('filter' in body):
+        raise ValueError('Either ids or filter is required')
+
+    if 'ids' in body:
+        ids = body['ids']
+        if not isinstance(ids, list) or not ids or not all(isinstance(id, str) for id in ids):
+            raise ValueError('ids must be a non empty list of employee ids')
+        if len(ids) > BATCH_LIMIT:
+            raise ValueError('At most {} ids per request'.format(BATCH_LIMIT))
+        ids = list(dict.fromkeys(ids))
+        return ids, [Employee.id.in_(ids)]
+
+    conditions = body['filter']
+    if not isinstance(conditions, dict) or not conditions:
+        raise ValueError('filter must be an object with at least one of: {}'.format(', '.join(FILTERS)))
+    unknown = [name for name in conditions if name not in FILTERS]
+    if unknown:
+        raise ValueError('filter must only use: {}'.format(', '.join(FILTERS)))
+    if 'is_active' in conditions and not isinstance(conditions['is_active'], bool):
+        raise ValueError('filter is_active must be true or false')
+
+    return None, [FILTERS[name](value) for name, value in conditions.items()]
+
+
+def parse_changes(body):
+    """Returns the column values a batch PATCH sets."""
+    changes = body.get('set')
+    if not isinstance(changes, dict) or not changes:
+        raise ValueError('set must be an object with at least one of: {}'.format(', '.join(UPDATABLE_FIELDS)))
+    unknown = [name for name in changes if name not in UPDATABLE_FIELDS]
+    if unknown:
+        raise ValueError('set must only use: {}'.format(', '.join(UPDATABLE_FIELDS)))
+
+    values = {}
+    for name, value in changes.items():
+        column, convert = UPDATABLE_FIELDS[name]
+        if convert is None:
+            if not isinstance(value, bool):
+                raise ValueError('{} must be true or false'.format(name))
+            values[column] = value
+            continue
+        try:
+            values[column] = convert(value)
+        except (TypeError, ValueError):
+            raise ValueError('{} is invalid'.format(name))
+
+    if 'age' in values and values['age'] not in AGE_RANGE:
+        raise ValueError('age is out of range')
+
+    # locked like Department.is_deleted does
+    if 'department_id' in values and db.session.execute(
+            db.select(Department.id).where(Department.id == values['department_id'], Department.is_active)
+            .with_for_update(read=True)).first() is None:
+        raise ValueError('department does not exist')
+
+    return values
+
+
+def select_targets(conditions):
+    rows = db.session.execute(
+        db.select(Employee.id, Employee.department_id, Employee.is_active, Employee.age)
+        .where(*conditions).limit(BATCH_LIMIT + 1).with_for_update()).mappings().all()
+    if len(rows) > BATCH_LIMIT:
+        raise ValueError('The filter matches more than {} employees'.format(BATCH_LIMIT))
+    return [dict(row) for row in rows]
+
+
+def count_files(rows):
+    """Adds to each row the number of files its employee has."""
+    counts = dict(db.session.execute(
+        db.select(File.employee_id, db.func.count(File.id))
+        .where(File.employee_id.in_([row['id'] for row in rows]))
+        .group_by(File.employee_id)).all())
+    for row in rows:
+        row['files'] = counts.get(row['id'], 0)
+
+
+def outcomes(ids, rows, status):
+    found = {row['id'] for row in rows}
+    if ids is None:
+        return [{'id': row['id'], 'status': status} for row in rows]
+    return [{'id': id, 'status': status if id in found else 'not_found'} for id in ids]
+
+
+def change_employees(ids, conditions, values, status):
+    rows = select_targets(conditions)
+    if not rows:
+        return outcomes(ids, rows, status), 0
+
+    moved = 'department_id' in values
+    if moved:
+        count_files(rows)
+
+    employees = Employee.__table__
+    now = datetime.utcnow()
+    changes = dict(values, modified_at=now)
+    if 'is_active' in values:
+        # only rows that change state get a new deactivation time
+        changes['deactivated_at'] = None if values['is_active'] else db.case(
+            (employees.c.is_active, now), else_=employees.c.deactivated_at)
+
+    db.session.execute(
+        db.update(employees).where(employees.c.id.in_([row['id'] for row in rows])).values(changes))
+
+    apply_employee_changes(db.session, rows, [dict(row, **values) for row in rows])
+    bump_versions(db.session.connection(), 'employees')
+    return outcomes(ids, rows, status), len(rows)
+
+
+def update_employees(ids, conditions, values):
+    """Applies `values` to the targeted employees and returns the per-id
+    outcomes and how many were updated. Employees of deleted departments
+    are only reactivated together with a move to an active one; otherwise
+    they are left out, as not found."""
+    if values.get('is_active') and 'department_id' not in values:
+        # locked like Department.is_deleted does
+        active_departments = db.select(Department.id).where(Department.is_active).with_for_update(read=True)
+        conditions = conditions + [Employee.department_id.in_(active_departments)]
+    return change_employees(ids, conditions, values, 'updated')
+
+
+def delete_employees(ids, conditions):
+    """Soft deletes the targeted active employees, like DELETE
+    /employees/<id>, and returns the per-id outcomes and how many were
+    deleted."""
+    return change_employees(ids, conditions + [Employee.is_active], {'is_active': False}, 'deleted')
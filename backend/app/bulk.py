@@ -0,0 +1,100 @@
+import csv
+import io
+import uuid
+from datetime import datetime
+
+from .models import db, Employee, Department
+from .utilities import validate_employee
+from .stats import apply_employee_deltas
+from .search import bump_versions
+
+
+# checked per row, the database would otherwise reject the whole batch
+TEXT_FIELDS = {
+    'firstname': Employee.__table__.c.firstname.type.length,
+    'lastname': Employee.__table__.c.lastname.type.length,
+}
+# what fits the integer column on Postgres
+AGE_RANGE = range(-2 ** 31, 2 ** 31)
+
+
+def read_csv_rows(stream):
+    return list(csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig')))
+
+
+def validate_rows(rows):
+    """Checks every row with the create_employee rules plus the checks a
+    single bad row would otherwise turn into a failed batch. Returns the
+    insertable rows and a per-row error report (rows are numbered from 1)."""
+    department_ids = {str(row['selectDepartment']) for row in rows
+                      if isinstance(row, dict) and row.get('selectDepartment')}
+    # deleted departments take no new employees; locked like Department.is_deleted does
+    existing_departments = set(db.session.execute(
+        db.select(Department.id).where(Department.id.in_(department_ids), Department.is_active)
+        .with_for_update(read=True)).scalars()) if department_ids else set()
+
+    now = datetime.utcnow()
+    valid_rows = []
+    errors = []
+
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append({'row': number, 'errors': ['row must be an object']})
+            continue
+
+        row_errors = validate_employee(row)
+
+        for field, length in TEXT_FIELDS.items():
+            if field not in row:
+                continue
+            if not isinstance(row[field], str):
+                row_errors.append('{} must be a string'.format(field))
+            elif len(row[field]) > length:
+                row_errors.append('{} must be at most {} characters'.format(field, length))
+
+        if 'age' in row:
+            try:
+                age = int(row['age'])
+            except (TypeError, ValueError):
+                row_errors.append('age must be an integer')
+            else:
+                if age not in AGE_RANGE:
+                    row_errors.append('age is out of range')
+
+        if 'selectDepartment' in row and str(row['selectDepartment']) not in existing_departments:
+            row_errors.append('department does not exist')
+
+        if row_errors:
+            errors.append({'row': number, 'errors': row_errors})
+            continue
+
+        valid_rows.append({
+            'id': str(uuid.uuid4()),
+            'firstname': row['firstname'],
+            'lastname': row['lastname'],
+            'age': age,
+            'is_active': True,
+            'department_id': str(row['selectDepartment']),
+            'created_at': now,
+            'row': number,
+        })
+
+    return valid_rows, errors
+
+
+def insert_employees(rows, batch_size):
+    """Inserts the validated rows with one executemany per batch inside the
+    caller's transaction, updates the department stats (Core inserts skip
+    their mapper events) and returns the created ids."""
+    ids = []
+    statement = db.insert(Employee.__table__)
+
+    for start in range(0, len(rows), batch_size):
+        batch = [{key: value for key, value in row.items() if key != 'row'}
+                 for row in rows[start:start + batch_size]]
+        db.session.execute(statement, batch)
+        ids.extend({'row': row['row'], 'id': row['id']} for row in rows[start:start + batch_size])
+
+    apply_employee_deltas(db.session, rows)
+    bump_versions(db.session.connection(), 'employees')
+    return ids
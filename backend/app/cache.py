@@ -0,0 +1,140 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request
+
+from config import config
+
+
+class MemoryBackend:
+    """Process local LRU. Each gunicorn worker keeps its own copy, so writes
+    served by one worker only reach the others once their entries expire;
+    use the redis backend when that matters."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.counters = {}
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (value, time.time() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def get_counters(self, names):
+        with self.lock:
+            return [self.counters.get(name, 0) for name in names]
+
+    def incr(self, name):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+
+class RedisBackend:
+    """Shared backend for any server speaking the Redis protocol."""
+
+    def __init__(self, url, prefix='employees-api:'):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, json.dumps(value), ex=ttl)
+
+    def get_counters(self, names):
+        return [int(value or 0) for value in self.client.mget([self.prefix + name for name in names])]
+
+    def incr(self, name):
+        self.client.incr(self.prefix + name)
+
+
+class ResponseCache:
+    """Caches successful JSON responses per path and query string.
+
+    Every entry is tagged with the tables its body was built from. Writes
+    bump the generation of a tag, and an entry is only served while the
+    generations it was stored with are still current."""
+
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+
+    def key(self, path, args):
+        return 'response:{}?{}'.format(path, '&'.join(
+            '{}={}'.format(name, value) for name, value in sorted(args.items(multi=True))))
+
+    def generations(self, tags):
+        return self.backend.get_counters(['generation:' + tag for tag in tags])
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.backend.incr('generation:' + tag)
+
+    def cached(self, tags):
+        """Route decorator; `tags` maps the request args to the tags the
+        response depends on."""
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                entry_tags = sorted(tags(request.args))
+                key = self.key(request.path, request.args)
+                generations = self.generations(entry_tags)
+
+                entry = self.backend.get(key)
+                if entry is not None and entry['generations'] == generations:
+                    response = current_app.response_class(entry['body'], mimetype='application/json')
+                    response.set_etag(entry['etag'])
+                    return response.make_conditional(request)
+
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+                body = response.get_data()
+                etag = hashlib.sha1(body).hexdigest()
+                self.backend.set(key, {
+                    'body': body.decode('utf-8'),
+                    'etag': etag,
+                    'generations': generations,
+                }, self.ttl)
+
+                response.set_etag(etag)
+                return response.make_conditional(request)
+            return wrapper
+        return decorator
+
+
+def create_backend():
+    if config.get('RESPONSE_CACHE_BACKEND', 'memory') == 'redis':
+        return RedisBackend(config['RESPONSE_CACHE_URL'])
+
+    return MemoryBackend(config.get('RESPONSE_CACHE_SIZE', 512))
+
+
+response_cache = ResponseCache(create_backend(), config.get('RESPONSE_CACHE_TTL', 60))
@@ -0,0 +1,138 @@
+"""Response compression negotiated through Accept-Encoding.
+
+gzip is always available; brotli (`br`) and zstd are offered when their
+packages are installed. Buffered responses below COMPRESSION_MIN_SIZE are
+sent as they are, streamed ones (the NDJSON export) are compressed chunk by
+chunk as the generator yields them.
+"""
+import zlib
+
+from flask import request
+
+from config import config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+MIN_SIZE = config.get('COMPRESSION_MIN_SIZE', 1024)
+LEVELS = dict({'br': 4, 'zstd': 3, 'gzip': 6}, **config.get('COMPRESSION_LEVELS', {}))
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson', 'text/csv', 'text/html', 'text/plain'}
+
+
+class GzipCompressor:
+
+    def __init__(self, level):
+        # wbits 31: zlib stream with a gzip header and trailer
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliCompressor:
+
+    def __init__(self, level):
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class ZstdCompressor:
+
+    def __init__(self, level):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+def available_compressors():
+    """Supported encodings, the preferred one first."""
+    compressors = {}
+    if brotli is not None:
+        compressors['br'] = BrotliCompressor
+    if zstandard is not None:
+        compressors['zstd'] = ZstdCompressor
+    compressors['gzip'] = GzipCompressor
+    return compressors
+
+
+COMPRESSORS = available_compressors()
+
+
+def negotiate(accept_encodings):
+    """The encoding with the highest q the client accepts, ties going to the
+    server's preference; None when only identity is acceptable."""
+    best, best_quality = None, 0
+    for encoding in COMPRESSORS:
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress_stream(chunks, compressor):
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def compress_response(response):
+    if (response.mimetype not in COMPRESSIBLE_MIMETYPES or response.direct_passthrough
+            or 'Content-Encoding' in response.headers or response.status_code in (204, 206, 304)
+            or response.status_code < 200 or request.method == 'HEAD'):
+        return response
+
+    response.vary.add('Accept-Encoding')
+
+    encoding = negotiate(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    compressor = COMPRESSORS[encoding](LEVELS[encoding])
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, compressor)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_SIZE:
+            return response
+        response.set_data(compressor.compress(data) + compressor.finish())
+
+    response.headers['Content-Encoding'] = encoding
+
+    # the compressed body is another representation of the same resource:
+    # a weak ETag still matches If-None-Match but not byte ranges
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+    return response
@@ -0,0 +1,73 @@
+"""CORS policy with its header sets computed once at startup.
+
+Preflight requests are answered by a WSGI middleware in front of Flask, so
+they never build a request context, run `authorize` or match a route. The
+other responses only get CORS headers when the request has an allowed
+`Origin`, same-origin requests are left alone.
+"""
+from config import config
+
+
+class CorsPolicy:
+
+    def __init__(self, origins, methods, headers, expose_headers=(), max_age=86400):
+        self.any_origin = '*' in origins
+        self.origins = frozenset(origins)
+
+        self.preflight_headers = [
+            ('Access-Control-Allow-Methods', ', '.join(methods)),
+            ('Access-Control-Allow-Headers', ', '.join(headers)),
+            ('Access-Control-Max-Age', str(max_age)),
+            ('Content-Length', '0'),
+        ]
+        self.response_headers = []
+        if expose_headers:
+            self.response_headers.append(('Access-Control-Expose-Headers', ', '.join(expose_headers)))
+
+    def allows(self, origin):
+        return origin is not None and (self.any_origin or origin in self.origins)
+
+    def origin_headers(self, origin):
+        if self.any_origin:
+            return [('Access-Control-Allow-Origin', '*')]
+        # the answer depends on Origin, caches must key on it
+        return [('Access-Control-Allow-Origin', origin), ('Vary', 'Origin')]
+
+    def preflight(self, origin):
+        if not self.allows(origin):
+            return [('Content-Length', '0')]
+        return self.origin_headers(origin) + self.preflight_headers
+
+    def apply(self, response, origin):
+        if not self.allows(origin):
+            return response
+        for name, value in self.origin_headers(origin) + self.response_headers:
+            if name == 'Vary':
+                response.vary.add(value)
+            else:
+                response.headers[name] = value
+        return response
+
+
+class PreflightMiddleware:
+    """Answers CORS preflights with 204 before the request reaches Flask."""
+
+    def __init__(self, wsgi_app, policy):
+        self.wsgi_app = wsgi_app
+        self.policy = policy
+
+    def __call__(self, environ, start_response):
+        if environ['REQUEST_METHOD'] == 'OPTIONS' and 'HTTP_ACCESS_CONTROL_REQUEST_METHOD' in environ:
+            start_response('204 No Content', self.policy.preflight(environ.get('HTTP_ORIGIN')))
+            return []
+        return self.wsgi_app(environ, start_response)
+
+
+def create_policy():
+    return CorsPolicy(
+        origins=config.get('CORS_ORIGINS', ['http://localhost:8080']),
+        methods=config.get('CORS_METHODS', ['GET', 'PATCH', 'POST', 'DELETE', 'OPTIONS']),
+        headers=config.get('CORS_HEADERS', ['Content-Type', 'X-ACCESS-TOKEN']),
+        expose_headers=config.get('CORS_EXPOSE_HEADERS', ['ETag']),
+        max_age=config.get('CORS_MAX_AGE', 86400),
+    )
@@ -0,0 +1,36 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+
+from config import config
+
+
+listener = None
+
+
+def setup_logging():
+    """Sends every record of the `app` loggers through a QueueHandler. Request
+    threads only enqueue the record; a QueueListener thread does the blocking
+    write, so logging never stalls a request."""
+    global listener
+    if listener is not None:
+        return
+
+    log_queue = queue.SimpleQueue()
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(
+        config.get('LOG_FORMAT', '%(asctime)s %(levelname)s [%(name)s] %(message)s')))
+
+    listener = logging.handlers.QueueListener(
+        log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    app_logger = logging.getLogger('app')
+    app_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    app_logger.propagate = False
+
+    for name, level in config.get('LOG_LEVELS', {'app': 'INFO'}).items():
+        logging.getLogger(name).setLevel(level)
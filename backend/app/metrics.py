@@ -0,0 +1,146 @@
+"""Per request timings exposed in the Prometheus text format on /metrics.
+
+Each request gets a RequestMetrics in `g` that the query auditing cursor
+events, the JSON encoders and `authorize` add to; when the response is ready its
+totals go into histograms labelled by route rule (not by path, so ids do not
+create new series). Histograms live in the process: with several workers,
+each one reports its own.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, escape(value)) for name, value in pairs) + '}'
+
+
+class Histogram:
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        # label values -> [count per bucket..., count above the last bucket, sum]
+        self.series = {}
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation),
+                 '# TYPE {} histogram'.format(self.name)]
+        with self.lock:
+            series = sorted((key, list(values)) for key, values in self.series.items())
+
+        for label_values, values in series:
+            pairs = list(zip(self.labels, label_values))
+            cumulative = 0
+            for bucket, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(
+                    self.name, format_labels(pairs + [('le', bucket)]), cumulative))
+            lines.append('{}_sum{} {}'.format(self.name, format_labels(pairs), values[-1]))
+            lines.append('{}_count{} {}'.format(self.name, format_labels(pairs), cumulative))
+
+        return lines
+
+
+request_seconds = Histogram(
+    'http_request_duration_seconds', 'Time to build the response.', ('method', 'route', 'status'))
+request_queries = Histogram(
+    'http_request_db_queries', 'Database queries issued per request.', ('route',), COUNT_BUCKETS)
+request_query_seconds = Histogram(
+    'http_request_db_seconds', 'Time spent in database queries per request.', ('route',))
+request_serialization_seconds = Histogram(
+    'http_request_serialization_seconds', 'Time spent building and encoding JSON per request.',
+    ('route',), FAST_BUCKETS)
+authorize_seconds = Histogram(
+    'authorize_duration_seconds', 'Time spent checking the access token.', (), FAST_BUCKETS)
+
+HISTOGRAMS = [request_seconds, request_queries, request_query_seconds,
+              request_serialization_seconds, authorize_seconds]
+
+
+class RequestMetrics:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.statements = []
+        self.serialization_seconds = 0.0
+        self.serializing = False
+
+
+def current():
+    if has_request_context():
+        return g.get('request_metrics')
+    return None
+
+
+def route():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def start_request():
+    g.request_metrics = RequestMetrics()
+
+
+def finish_request(response):
+    metrics = g.pop('request_metrics', None)
+    if metrics is None:
+        return response
+
+    rule = route()
+    request_seconds.observe(time.perf_counter() - metrics.started, request.method, rule, response.status_code)
+    request_queries.observe(metrics.queries, rule)
+    request_query_seconds.observe(metrics.query_seconds, rule)
+    request_serialization_seconds.observe(metrics.serialization_seconds, rule)
+    return response
+
+
+@contextmanager
+def timed_serialization():
+    metrics = current()
+    # nested encoders (dumps falling back to app.json) count once
+    if metrics is None or metrics.serializing:
+        yield
+        return
+
+    metrics.serializing = True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serialization_seconds += time.perf_counter() - started
+        metrics.serializing = False
+
+
+def render():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return '\n'.join(lines) + '\n'
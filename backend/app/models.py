@@ -1,18 +1,104 @@
 from flask_sqlalchemy import SQLAlchemy
-from config.local import config
+from flask_migrate import Migrate
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from config import config
+from .pool import engine_options, RoutingSession
+from . import passwords
 import uuid
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+import os
 import sys
+import logging
 
 
-db = SQLAlchemy()
+logger = logging.getLogger(__name__)
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+migrate = Migrate()
+
+MIGRATIONS_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+# databases whose schema this process already created or checked
+prepared_databases = set()
+
+
+class SchemaOutdated(Exception):
+    pass
 
 def setup_db(app, database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = config['DATABASE_URI'] if database_path is None else database_path
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
+    if config.get('DATABASE_REPLICA_URI') and database_path is None:
+        app.config["SQLALCHEMY_BINDS"] = {
+            'replica': dict(url=config['DATABASE_REPLICA_URI'],
+                            **engine_options(config['DATABASE_REPLICA_URI'])),
+        }
     db.app = app
     db.init_app(app)
-    db.create_all()
+    migrate.init_app(app, db, directory=MIGRATIONS_FOLDER)
+    prepare_schema(app, config.get('DATABASE_SCHEMA', 'create'))
+
+
+def prepare_schema(app, mode):
+    """`create` bootstraps an empty database, `check` only compares the
+    revision in `alembic_version` with the migration heads and `skip` trusts
+    the deploy to have run `flask db upgrade`. Either is done once per
+    database and process, not on every create_app."""
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if mode == 'skip' or uri in prepared_databases:
+        return
+    if mode == 'check' and running_migrations():
+        # `flask db upgrade` creates the app too, to fix what the check rejects
+        return
+
+    with app.app_context():
+        if mode == 'check':
+            check_schema()
+        else:
+            bootstrap_schema()
+
+    prepared_databases.add(uri)
+
+
+def running_migrations():
+    return os.environ.get('FLASK_RUN_FROM_CLI') == 'true' and 'db' in sys.argv[1:]
+
+
+def migration_heads():
+    from alembic.script import ScriptDirectory
+    return set(ScriptDirectory(MIGRATIONS_FOLDER).get_heads())
+
+
+def check_schema():
+    try:
+        with db.engine.connect() as connection:
+            current = set(connection.execute(db.text('SELECT version_num FROM alembic_version')).scalars())
+    except (OperationalError, ProgrammingError):
+        # no alembic_version table: the database was never migrated
+        current = set()
+
+    heads = migration_heads()
+    if current != heads:
+        raise SchemaOutdated('Database schema is at {}, expected {}: run `flask db upgrade`'.format(
+            ', '.join(sorted(current)) or 'no revision', ', '.join(sorted(heads))))
+
+
+def bootstrap_schema():
+    """Runs every migration on an empty database, so it gets the same schema
+    as `flask db upgrade` would give it, including what only migrations
+    create (extensions, trigram indexes, seeded rows). A database that
+    already has tables is only changed by `flask db upgrade`."""
+    with db.engine.connect() as connection:
+        if db.inspect(connection).get_table_names():
+            return
+
+    from alembic import command
+
+    logger.info('Empty database, running the migrations')
+    alembic_config = migrate.get_config(MIGRATIONS_FOLDER)
+    # keep the application's logging, env.py only sets it up for the CLI
+    alembic_config.attributes['configure_logger'] = False
+    command.upgrade(alembic_config, 'heads')
 
 class Employee(db.Model):
     __tablename__ = 'employees'
@@ -25,8 +111,21 @@ class Employee(db.Model):
     department_id = db.Column(db.String(36), db.ForeignKey('departments.id'), nullable=False)
     created_at = db.Column(db.DateTime(timezone=True), nullable=False)
     modified_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    deactivated_at = db.Column(db.DateTime(timezone=True), nullable=True)
     files = db.relationship('File', backref='employee', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_employees_department_id', 'department_id'),
+        db.Index('ix_employees_created_at_id', 'created_at', 'id'),
+        # the default lists only read active rows, the archiver only inactive
+        # ones; each predicate is written the way the dialect renders it, or
+        # the planner does not match the index
+        db.Index('ix_employees_active_created_at_id', 'created_at', 'id',
+                 postgresql_where=db.text('is_active'), sqlite_where=db.text('is_active = 1')),
+        db.Index('ix_employees_inactive_deactivated_at', 'deactivated_at',
+                 postgresql_where=db.text('NOT is_active'), sqlite_where=db.text('is_active = 0')),
+    )
+
 
     def __init__(self, firstname, lastname, age, department_id):
         self.firstname = firstname
@@ -38,9 +137,13 @@ class Employee(db.Model):
 
     def __repr__(self):
         return '<Employee %r %r>' % (self.firstname, self.lastname)
+
+    def deactivate(self):
+        self.is_active = False
+        self.deactivated_at = datetime.utcnow()
     
-    def serialize(self):
-        return {
+    def serialize(self, expand=()):
+        employee = {
             'id': self.id,
             'firstname': self.firstname,
             'lastname': self.lastname,
@@ -50,50 +153,158 @@ class Employee(db.Model):
             'created_at': self.created_at,
             'department_id': self.department_id,
             'modified_at': self.modified_at,
+            'deactivated_at': self.deactivated_at,
         }
+
+        if 'department' in expand:
+            employee['department'] = self.department.serialize() if self.department else None
+
+        if 'files' in expand:
+            employee['files'] = [file.serialize() for file in self.files]
+
+        return employee
     
 class File(db.Model):
     __tablename__ = 'files'
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     filename = db.Column(db.String(120), nullable=False)
     employee_id = db.Column(db.String(36), db.ForeignKey('employees.id'), nullable=False)
+    content_hash = db.Column(db.String(64), nullable=True)
+    size = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime(timezone=True), nullable=False)
     modified_at = db.Column(db.DateTime(timezone=True), nullable=True)
 
-    def __init__(self, filename, employee_id):
+    __table_args__ = (
+        db.Index('ix_files_employee_id_created_at', 'employee_id', 'created_at'),
+    )
+
+    def __init__(self, filename, employee_id, content_hash=None, size=None):
         self.filename = filename
         self.employee_id = employee_id
+        self.content_hash = content_hash
+        self.size = size
         self.created_at = datetime.utcnow()
 
+    def serialize(self):
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'employee_id': self.employee_id,
+            'content_hash': self.content_hash,
+            'size': self.size,
+            'created_at': self.created_at,
+            'modified_at': self.modified_at,
+        }
+
 
 class Department(db.Model):
     __tablename__ = 'departments'
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     name = db.Column(db.String(120), nullable=False)
     short_name = db.Column(db.String(20), nullable=False)
+    is_active = db.Column(db.Boolean(), nullable=False, default=True)
     created_at = db.Column(db.DateTime(timezone=True), nullable=False)
     modified_at = db.Column(db.DateTime(timezone=True), nullable=True)
     employees = db.relationship('Employee', backref='department', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_departments_name_id', 'name', 'id'),
+    )
+
 
     def __init__(self, name, short_name):
         self.name = name
         self.short_name = short_name
+        self.is_active = True
         self.created_at = datetime.utcnow()
 
     def __repr__(self):
         return '<Department %r %r>' % (self.name, self.short_name)
+
+    @staticmethod
+    def is_deleted(department_id):
+        """Whether the department exists but was deleted. Its row stays
+        locked (FOR SHARE) until the caller commits, so delete_department,
+        which locks it FOR UPDATE, cannot deactivate it under a new employee."""
+        # callers may have changed rows they have not validated yet
+        with db.session.no_autoflush:
+            is_active = db.session.execute(
+                db.select(Department.is_active).where(Department.id == str(department_id))
+                .with_for_update(read=True)).scalar()
+        return is_active is False
     
-    def serialize(self):
-        return {
+    def serialize(self, expand=()):
+        department = {
             'id': self.id,
             'name': self.name,
             'short_name': self.short_name,
             'created_at': self.created_at,
             'modified_at': self.modified_at,
         }
+
+        if 'employees' in expand:
+            department['employees'] = [employee.serialize() for employee in self.employees]
+
+        return department
     
 
+class ArchivedEmployee(db.Model):
+    """An employee moved out of `employees` by app/archive.py. No foreign
+    key: its department may be deleted later."""
+    __tablename__ = 'employees_archive'
+    id = db.Column(db.String(36), primary_key=True)
+    firstname = db.Column(db.String(80), nullable=False)
+    lastname = db.Column(db.String(120), nullable=False)
+    age = db.Column(db.Integer, nullable=False)
+    image = db.Column(db.String(500), nullable=True)
+    is_active = db.Column(db.Boolean(), nullable=False)
+    department_id = db.Column(db.String(36), nullable=False, index=True)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    modified_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    deactivated_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    archived_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+    def __repr__(self):
+        return '<ArchivedEmployee %r %r>' % (self.firstname, self.lastname)
+
+
+class ArchivedFile(db.Model):
+    """A file record archived together with its employee."""
+    __tablename__ = 'files_archive'
+    id = db.Column(db.String(36), primary_key=True)
+    filename = db.Column(db.String(120), nullable=False)
+    employee_id = db.Column(db.String(36), nullable=False, index=True)
+    content_hash = db.Column(db.String(64), nullable=True)
+    size = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    modified_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    archived_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+
+class DepartmentStats(db.Model):
+    """Running totals per department, kept current by app/stats.py."""
+    __tablename__ = 'department_stats'
+    department_id = db.Column(db.String(36), db.ForeignKey('departments.id', ondelete='CASCADE'), primary_key=True)
+    employees = db.Column(db.Integer, nullable=False, default=0)
+    active_employees = db.Column(db.Integer, nullable=False, default=0)
+    age_total = db.Column(db.BigInteger, nullable=False, default=0)
+    files = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return 'DepartmentStats: {}'.format(self.department_id)
+
+
+class SearchIndexVersion(db.Model):
+    """Write counter per table, telling app/search.py when an in-process
+    index is out of date."""
+    __tablename__ = 'search_index_versions'
+    name = db.Column(db.String(40), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return 'SearchIndexVersion: {} {}'.format(self.name, self.version)
+
+
 class User(db.Model):
     __tablename__ = 'users'
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
@@ -108,18 +319,22 @@ class User(db.Model):
     
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(password)
+        # same method and process pool as the user routes
+        self.password_hash = passwords.hash_password(password)
 
 
     def verify_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return passwords.verify_password(self.password_hash, password)
     
     def __repr__(self):
         return 'User: {}, {}'.format(self.id, self.username)
     
-    def __init__(self, username, password):
+    def __init__(self, username, password=None, password_hash=None):
         self.username = username
-        self.password = password
+        if password_hash is not None:
+            self.password_hash = password_hash
+        else:
+            self.password = password
         self.created_at = datetime.utcnow()
 
     def serialize(self):
@@ -134,8 +349,7 @@ class User(db.Model):
             db.session.commit()
             user_created_id = self.id
         except Exception as e:
-            print(sys.exc_info())
-            print('e: ', e)
+            logger.exception('Error inserting user')
             db.session.rollback()
         finally:
             db.session.close()
@@ -148,10 +362,38 @@ class User(db.Model):
             db.session.delete(self)
             db.session.commit()
         except Exception as e:
-            print(sys.exc_info())
-            print('e: ', e)
+            logger.exception('Error deleting user')
             db.session.rollback()
 
 
 
-    
\ No newline at end of file
+    
+
+
+class RevokedToken(db.Model):
+    """A signed out token, kept until it would have expired anyway. Times are
+    unix seconds like the token's own `exp` claim."""
+    __tablename__ = 'revoked_tokens'
+    jti = db.Column(db.String(36), primary_key=True)
+    expires_at = db.Column(db.Integer, nullable=False, index=True)
+    revoked_at = db.Column(db.Integer, nullable=False, index=True)
+
+    def __init__(self, jti, expires_at, revoked_at):
+        self.jti = jti
+        self.expires_at = expires_at
+        self.revoked_at = revoked_at
+
+    def __repr__(self):
+        return 'RevokedToken: {}'.format(self.jti)
+
+
+class DeletedUser(db.Model):
+    """A deleted user, kept until every token issued to them has expired so
+    the tokens are rejected meanwhile. Times are unix seconds."""
+    __tablename__ = 'deleted_users'
+    user_id = db.Column(db.String(36), primary_key=True)
+    expires_at = db.Column(db.Integer, nullable=False, index=True)
+    deleted_at = db.Column(db.Integer, nullable=False, index=True)
+
+    def __repr__(self):
+        return 'DeletedUser: {}'.format(self.user_id)
@@ -0,0 +1,68 @@
+import base64
+import json
+from datetime import datetime
+
+from .models import db
+from config import config
+
+
+def encode_cursor(values):
+    raw = json.dumps([value.isoformat() if isinstance(value, datetime) else value
+                      for value in values])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, columns):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('after is not a valid cursor')
+
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError('after is not a valid cursor')
+
+    decoded = []
+    for column, value in zip(columns, values):
+        if column.type.python_type is datetime:
+            try:
+                value = datetime.fromisoformat(value)
+            except (TypeError, ValueError):
+                raise ValueError('after is not a valid cursor')
+        decoded.append(value)
+
+    return decoded
+
+
+def is_paginated(args):
+    return 'limit' in args or 'after' in args
+
+
+def parse_page_args(args):
+    max_page_size = config.get('MAX_PAGE_SIZE', 500)
+    limit = args.get('limit', config.get('DEFAULT_PAGE_SIZE', 50))
+
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ValueError('limit must be an integer')
+
+    if limit < 1 or limit > max_page_size:
+        raise ValueError('limit must be between 1 and {}'.format(max_page_size))
+
+    return limit, args.get('after', None)
+
+
+def paginate(query, columns, limit, after=None):
+    """Keyset pagination: returns at most `limit` rows ordered by `columns`
+    plus the cursor of the next page (None on the last page)."""
+    if after:
+        query = query.filter(db.tuple_(*columns) > tuple(decode_cursor(after, columns)))
+
+    rows = query.order_by(*columns).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], column.key) for column in columns])
+
+    return rows, next_cursor
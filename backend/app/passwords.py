@@ -0,0 +1,88 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from config import config
+
+
+logger = logging.getLogger(__name__)
+
+METHOD = config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:260000')
+SALT_LENGTH = config.get('PASSWORD_SALT_LENGTH', 16)
+WORKERS = config.get('PASSWORD_HASH_WORKERS', 2)
+
+# hashing jobs allowed to run or wait for the pool at the same time, the
+# rest of the requests fail fast instead of piling up behind them
+slots = threading.BoundedSemaphore(config.get('PASSWORD_HASH_CONCURRENCY', 4))
+
+executor = None
+executor_lock = threading.Lock()
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def get_executor():
+    # Created on first use so every gunicorn worker has its own pool. Not
+    # forked: a fork of a threaded worker copies locks other threads hold
+    # (logging, the connection pool) and the child can hang on them.
+    global executor
+    with executor_lock:
+        if executor is None:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            executor = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context(method))
+        return executor
+
+
+def discard_executor(broken):
+    # a pool whose child died (e.g. OOM killed) rejects every later job
+    global executor
+    with executor_lock:
+        if executor is broken:
+            executor = None
+    broken.shutdown(wait=False)
+
+
+def submit(function, *args):
+    pool = get_executor()
+    try:
+        return pool.submit(function, *args).result()
+    except BrokenProcessPool:
+        discard_executor(pool)
+        raise
+
+
+def run(function, *args):
+    if not slots.acquire(timeout=config.get('PASSWORD_HASH_WAIT', 5)):
+        raise HashingBusy()
+
+    try:
+        if not WORKERS:
+            return function(*args)
+        try:
+            return submit(function, *args)
+        except BrokenProcessPool:
+            logger.warning('Password hashing pool broke, starting a new one')
+        try:
+            return submit(function, *args)
+        except BrokenProcessPool:
+            raise HashingBusy()
+    finally:
+        slots.release()
+
+
+def hash_password(password):
+    return run(generate_password_hash, password, METHOD, SALT_LENGTH)
+
+
+def verify_password(password_hash, password):
+    return run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    return password_hash.split('$', 1)[0] != METHOD
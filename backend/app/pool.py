@@ -0,0 +1,110 @@
+import threading
+import time
+
+from flask import has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import exc, make_url
+from sqlalchemy.pool import QueuePool
+
+from config import config
+
+
+READ_METHODS = {'GET', 'HEAD'}
+
+
+class PoolMetrics:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record_wait(self, seconds):
+        with self.lock:
+            self.checkouts += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def record_timeout(self):
+        with self.lock:
+            self.timeouts += 1
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that records how long callers wait for a connection, which
+    is where a saturated pool shows up first."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        finally:
+            self.metrics.record_wait(time.perf_counter() - started)
+
+    def stats(self):
+        with self.metrics.lock:
+            checkouts = self.metrics.checkouts
+            return {
+                'size': self.size(),
+                'checked_in': self.checkedin(),
+                'checked_out': self.checkedout(),
+                'overflow': max(self.overflow(), 0),
+                'max_overflow': self._max_overflow,
+                'checkouts': checkouts,
+                'timeouts': self.metrics.timeouts,
+                'avg_wait_ms': round(self.metrics.wait_seconds * 1000 / checkouts, 3) if checkouts else 0.0,
+                'max_wait_ms': round(self.metrics.max_wait_seconds * 1000, 3),
+            }
+
+
+def engine_options(database_uri):
+    """Pool and timeout settings for a database URI. SQLite keeps the driver
+    defaults Flask-SQLAlchemy picks for it."""
+    url = make_url(database_uri)
+    if url.get_backend_name() == 'sqlite':
+        return {}
+
+    options = {
+        'poolclass': MeteredQueuePool,
+        'pool_size': config.get('DATABASE_POOL_SIZE', 5),
+        'max_overflow': config.get('DATABASE_MAX_OVERFLOW', 10),
+        'pool_timeout': config.get('DATABASE_POOL_TIMEOUT', 30),
+        'pool_recycle': config.get('DATABASE_POOL_RECYCLE', 1800),
+        'pool_pre_ping': config.get('DATABASE_POOL_PRE_PING', True),
+    }
+
+    statement_timeout = config.get('DATABASE_STATEMENT_TIMEOUT')
+    if statement_timeout and url.get_backend_name() == 'postgresql':
+        options['connect_args'] = {'options': '-c statement_timeout={}'.format(statement_timeout)}
+
+    return options
+
+
+class RoutingSession(Session):
+    """Sends the queries of read-only requests to the `replica` bind when one
+    is configured. Anything flushed inside the request still goes to the
+    primary."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() \
+                and request.method in READ_METHODS and 'replica' in self._db.engines:
+            return self._db.engines['replica']
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def pool_stats(engines):
+    return {
+        'primary' if key is None else key: engine.pool.stats()
+        for key, engine in engines.items()
+        if isinstance(engine.pool, MeteredQueuePool)
+    }
@@ -0,0 +1,87 @@
+"""Opt-in cProfile of single requests.
+
+A request is profiled when it carries `X-Profile: <PROFILER_SECRET>` or is
+picked by PROFILER_SAMPLE_RATE. Sampled profiles are only kept when the
+request took at least PROFILER_SLOW_SECONDS. Kept profiles are written to
+PROFILER_FOLDER (open them with `python -m pstats` or snakeviz) and their top
+functions are logged. Only one request is profiled at a time.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from flask import g, request
+
+from config import config
+
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'X-Profile'
+SECRET = config.get('PROFILER_SECRET', None)
+SAMPLE_RATE = config.get('PROFILER_SAMPLE_RATE', 0.0)
+SLOW_SECONDS = config.get('PROFILER_SLOW_SECONDS', 1.0)
+FOLDER = config.get('PROFILER_FOLDER', 'profiles')
+
+lock = threading.Lock()
+
+
+def start():
+    requested = SECRET is not None and request.headers.get(HEADER) == SECRET
+    sampled = SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE
+    if not (requested or sampled) or not lock.acquire(blocking=False):
+        return
+
+    profile = cProfile.Profile()
+    g.profile = (profile, requested, time.perf_counter())
+    profile.enable()
+
+
+def save(profile, elapsed):
+    os.makedirs(FOLDER, exist_ok=True)
+    name = '{:%Y%m%dT%H%M%S}_{}_{}.prof'.format(
+        datetime.utcnow(), request.endpoint or 'unmatched', uuid.uuid4().hex[:8])
+    path = os.path.join(FOLDER, name)
+    profile.dump_stats(path)
+
+    summary = io.StringIO()
+    pstats.Stats(profile, stream=summary).sort_stats('cumulative').print_stats(15)
+    logger.info('Profiled %s %s in %.1f ms, saved to %s\n%s',
+                request.method, request.path, elapsed * 1000, path, summary.getvalue())
+    return name
+
+
+def stop(response):
+    entry = g.pop('profile', None)
+    if entry is None:
+        return response
+
+    profile, requested, started = entry
+    profile.disable()
+    lock.release()
+
+    elapsed = time.perf_counter() - started
+    if requested or elapsed >= SLOW_SECONDS:
+        try:
+            name = save(profile, elapsed)
+            if requested:
+                response.headers['X-Profile-File'] = name
+        except Exception:
+            logger.exception('Error saving profile')
+
+    return response
+
+
+def discard(exception=None):
+    """Teardown hook: stops a profile whose request never got a response."""
+    entry = g.pop('profile', None)
+    if entry is not None:
+        entry[0].disable()
+        lock.release()
@@ -0,0 +1,129 @@
+"""Query auditing.
+
+Every query goes through the cursor events below: inside a request it is
+counted and timed in the request's metrics; one slower than
+SLOW_QUERY_SECONDS is logged and its plan is fetched with EXPLAIN on another
+connection, off the request thread. After the response is built, a request
+that issued more queries than its route's budget is logged, or turned into a
+500 when budgets are enforced (the test suite does), so an N+1 fails a test
+instead of shipping.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import config
+from .metrics import current
+
+
+logger = logging.getLogger(__name__)
+
+SLOW_SECONDS = config.get('SLOW_QUERY_SECONDS', 0.5)
+EXPLAIN_INTERVAL = config.get('SLOW_QUERY_EXPLAIN_INTERVAL', 300)
+DEFAULT_BUDGET = config.get('QUERY_BUDGET_DEFAULT', 10)
+
+explainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='explain')
+# statement -> when its plan was last logged, so a hot slow query is
+# explained once per EXPLAIN_INTERVAL instead of on every execution
+explained = {}
+explained_lock = threading.Lock()
+
+
+def query_budget(limit):
+    """Route decorator: the most queries one request to the route may issue."""
+    def decorator(f):
+        f.query_budget = limit
+        return f
+    return decorator
+
+
+def audited(connection):
+    # bookkeeping queries (revocation sync, EXPLAIN itself) opt out
+    return connection.get_execution_options().get('audit', True)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    connection.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - connection.info['query_started'].pop()
+    if not audited(connection):
+        return
+
+    metrics = current()
+    if metrics is not None:
+        metrics.queries += 1
+        metrics.query_seconds += elapsed
+        metrics.statements.append(statement)
+
+    if elapsed >= SLOW_SECONDS:
+        logger.warning('Slow query (%.1f ms): %s', elapsed * 1000, statement)
+        if not executemany:
+            schedule_explain(connection.engine, statement, parameters)
+
+
+@event.listens_for(Engine, 'handle_error')
+def handle_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('query_started'):
+        connection.info['query_started'].pop()
+
+
+def schedule_explain(engine, statement, parameters):
+    if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return
+
+    now = time.monotonic()
+    with explained_lock:
+        if now - explained.get(statement, -EXPLAIN_INTERVAL) < EXPLAIN_INTERVAL:
+            return
+        explained[statement] = now
+
+    explainer.submit(explain, engine, statement, parameters)
+
+
+def explain(engine, statement, parameters):
+    prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    try:
+        with engine.connect() as connection:
+            rows = connection.execution_options(audit=False).exec_driver_sql(
+                prefix + statement, parameters).all()
+        logger.warning('Plan of slow query: %s\n%s', statement,
+                       '\n'.join(' '.join(str(column) for column in row) for row in rows))
+    except Exception:
+        logger.exception('Error explaining slow query')
+
+
+def check_budget(response):
+    metrics = current()
+    view = current_app.view_functions.get(request.endpoint)
+    if metrics is None or view is None:
+        return response
+
+    budget = getattr(view, 'query_budget', DEFAULT_BUDGET)
+    if budget is None or metrics.queries <= budget:
+        return response
+
+    repeated = Counter(metrics.statements).most_common(3)
+    message = '{} issued {} queries, its budget is {}'.format(request.endpoint, metrics.queries, budget)
+    if not current_app.config.get('ENFORCE_QUERY_BUDGETS', False):
+        logger.warning('Query budget exceeded: %s; most repeated: %s', message, repeated)
+        return response
+
+    logger.error('Query budget exceeded: %s; most repeated: %s', message, repeated)
+    response = jsonify({
+        'success': False,
+        'message': 'Query budget exceeded: ' + message,
+        'repeated_queries': [{'statement': statement, 'count': count} for statement, count in repeated],
+    })
+    response.status_code = 500
+    return response
@@ -0,0 +1,392 @@
+import re
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+
+from sqlalchemy.orm import Session
+
+from config import config
+from .models import db, Employee, Department, SearchIndexVersion
+from .pagination import encode_cursor, decode_cursor
+
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+EXACT_SCORE = 3
+PREFIX_SCORE = 2
+SUBSTRING_SCORE = 1
+
+# how often a loaded index checks whether another process changed its table
+REFRESH_SECONDS = config.get('SEARCH_INDEX_REFRESH_SECONDS', 5)
+FETCH_BATCH_SIZE = config.get('SEARCH_FETCH_BATCH_SIZE', 500)
+
+versions = SearchIndexVersion.__table__
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall((text or '').lower())
+
+
+class SearchIndex:
+    """In-process inverted index used when the database has no trigram
+    support. Tokens are kept sorted so prefix lookups are a bisect instead
+    of a scan over every document. Each document also keeps the column
+    values lists are ordered by, so hits are ranked and paged in Python."""
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.RLock()
+        self.loaded = False
+        # the version of the table the index was loaded at (see refresh())
+        self.version = None
+        self.checked_at = 0.0
+        self.documents = {}
+        self.records = {}
+        self.postings = {}
+        self.tokens = []
+
+    def add(self, doc_id, fields, record):
+        with self.lock:
+            self.remove(doc_id)
+            tokens = set()
+            for field in fields:
+                tokens.update(tokenize(field))
+
+            self.documents[doc_id] = tokens
+            self.records[doc_id] = record
+            for token in tokens:
+                if token not in self.postings:
+                    self.postings[token] = set()
+                    insort(self.tokens, token)
+                self.postings[token].add(doc_id)
+
+    def remove(self, doc_id):
+        with self.lock:
+            self.records.pop(doc_id, None)
+            for token in self.documents.pop(doc_id, ()):
+                ids = self.postings[token]
+                ids.discard(doc_id)
+                if not ids:
+                    del self.postings[token]
+                    del self.tokens[bisect_left(self.tokens, token)]
+
+    def clear(self):
+        with self.lock:
+            self.loaded = False
+            self.version = None
+            self.documents.clear()
+            self.records.clear()
+            self.postings.clear()
+            del self.tokens[:]
+
+    def match(self, token):
+        scores = {}
+        position = bisect_left(self.tokens, token)
+        while position < len(self.tokens) and self.tokens[position].startswith(token):
+            indexed_token = self.tokens[position]
+            score = EXACT_SCORE if indexed_token == token else PREFIX_SCORE
+            for doc_id in self.postings[indexed_token]:
+                scores[doc_id] = max(score, scores.get(doc_id, 0))
+            position += 1
+        return scores
+
+    def search(self, text):
+        """Returns {doc_id: score} for the documents matching every token."""
+        with self.lock:
+            results = None
+            for token in tokenize(text):
+                matches = self.match(token)
+                if results is None:
+                    results = matches
+                else:
+                    results = {doc_id: score + matches[doc_id]
+                               for doc_id, score in results.items()
+                               if doc_id in matches}
+                if not results:
+                    break
+            return results or {}
+
+    def matches(self, model, text, order):
+        with self.lock:
+            scores = self.search(text)
+            records = {doc_id: self.records[doc_id] for doc_id in scores}
+        return IndexMatches(model, scores, records, order)
+
+
+class IndexMatches:
+    """Hits of a SearchIndex. They are ranked and paged in Python and only
+    the rows that are returned are fetched, by id, so a search costs as much
+    as the rows it returns rather than growing with the square of the hits."""
+
+    def __init__(self, model, scores, records, order):
+        self.model = model
+        self.scores = scores
+        self.records = records
+        # record keys breaking ties between equal scores
+        self.order = order
+
+    def fetch(self, query, ids):
+        """The rows of `query` with these ids, in the order of `ids`. Ids
+        the query filters out (or that no longer exist) are skipped."""
+        rows = {}
+        for start in range(0, len(ids), FETCH_BATCH_SIZE):
+            for row in query.filter(self.model.id.in_(ids[start:start + FETCH_BATCH_SIZE])):
+                rows[row.id] = row
+        return [rows[doc_id] for doc_id in ids if doc_id in rows]
+
+    def all(self, query):
+        """Every matching row, best match first."""
+        ranked = sorted(self.scores, key=lambda doc_id: (
+            -self.scores[doc_id], *[self.records[doc_id][name] for name in self.order], doc_id))
+        return self.fetch(query, ranked)
+
+    def page(self, query, columns, limit, after=None):
+        """Keyset page over `columns`, like pagination.paginate()."""
+        names = [column.key for column in columns]
+
+        def key(doc_id):
+            return tuple(self.records[doc_id][name] for name in names)
+
+        candidates = sorted(self.scores, key=key)
+        if after:
+            bound = tuple(decode_cursor(after, columns))
+            candidates = candidates[bisect_right([key(doc_id) for doc_id in candidates], bound):]
+
+        # usually one query; more only when rows were filtered out
+        rows = []
+        position = 0
+        while len(rows) <= limit and position < len(candidates):
+            batch = candidates[position:position + limit + 1 - len(rows)]
+            position += len(batch)
+            rows.extend(self.fetch(query, batch))
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([getattr(rows[-1], name) for name in names])
+
+        return rows, next_cursor
+
+
+employees_index = SearchIndex('employees')
+departments_index = SearchIndex('departments')
+INDEXES = {index.name: index for index in (employees_index, departments_index)}
+
+
+def uses_sql_search():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def escape_like(token):
+    return token.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def sql_search(query, columns, text):
+    """Filters `query` so every token matches one of `columns` and returns it
+    with a rank expression (exact > prefix > substring, summed per token)."""
+    tokens = tokenize(text)
+    if not tokens:
+        return query.filter(db.false()), db.literal(0)
+
+    rank = None
+    for token in tokens:
+        escaped = escape_like(token)
+        query = query.filter(db.or_(*[column.ilike('%{}%'.format(escaped), escape='\\')
+                                      for column in columns]))
+
+        column_ranks = [db.case(
+            (db.func.lower(column) == token, EXACT_SCORE),
+            (column.ilike('{}%'.format(escaped), escape='\\'), PREFIX_SCORE),
+            else_=SUBSTRING_SCORE
+        ) for column in columns]
+        token_rank = db.func.greatest(*column_ranks) if len(column_ranks) > 1 else column_ranks[0]
+        rank = token_rank if rank is None else rank + token_rank
+
+    return query, rank
+
+
+def read_version(name):
+    return db.session.execute(
+        db.select(versions.c.version).where(versions.c.name == name)).scalar() or 0
+
+
+def bump_versions(connection, *names):
+    """Marks the tables as changed in the writer's transaction, so every
+    process reloads its index of them. Returns {name: new version}."""
+    if connection.engine.dialect.name == 'postgresql':
+        # served by the trigram indexes, there is no index to keep fresh
+        return {}
+
+    statement = db.update(versions).where(versions.c.name.in_(names)).values(version=versions.c.version + 1)
+    if connection.dialect.update_returning:
+        bumped = dict(connection.execute(statement.returning(versions.c.name, versions.c.version)).all())
+    else:
+        connection.execute(statement)
+        bumped = dict(connection.execute(
+            db.select(versions.c.name, versions.c.version).where(versions.c.name.in_(names))).all())
+    for name in names:
+        if name not in bumped:
+            connection.execute(db.insert(versions).values(name=name, version=1))
+            bumped[name] = 1
+    return bumped
+
+
+def refresh(index, load):
+    """Loads the index on first use. After that, at most every
+    REFRESH_SECONDS, reloads it when the table's version in the database
+    moved past the one it was loaded at, i.e. another process wrote to it."""
+    with index.lock:
+        now = time.monotonic()
+        if index.loaded and now - index.checked_at < REFRESH_SECONDS:
+            return
+
+        version = read_version(index.name)
+        index.checked_at = now
+        if index.loaded and version == index.version:
+            return
+
+        # the version is read first: writes committed while loading bump it
+        # again and trigger the next reload
+        index.clear()
+        load()
+        index.version = version
+        index.loaded = True
+
+
+def load_employees_index():
+    rows = db.session.execute(
+        db.select(Employee.id, Employee.firstname, Employee.lastname, Employee.created_at, Department.name)
+        .join(Department, Employee.department_id == Department.id))
+    for employee_id, firstname, lastname, created_at, department_name in rows:
+        employees_index.add(employee_id, (firstname, lastname, department_name),
+                            employee_record(employee_id, firstname, created_at))
+
+
+def load_departments_index():
+    rows = db.session.execute(db.select(Department.id, Department.name, Department.short_name))
+    for department_id, name, short_name in rows:
+        departments_index.add(department_id, (name, short_name), department_record(department_id, name))
+
+
+def employee_record(employee_id, firstname, created_at):
+    # the ranking tie-break and the keyset columns of GET /employees
+    return {'id': employee_id, 'firstname': firstname, 'created_at': created_at}
+
+
+def department_record(department_id, name):
+    return {'id': department_id, 'name': name}
+
+
+def search_employees(text):
+    """Returns an Employee query matching `text` against firstname, lastname
+    and department name, plus the ordering that puts the best match first.
+    Without trigram support the query is not filtered: the third value then
+    holds the ranked hits of the in-process index, which pick the rows."""
+    if uses_sql_search():
+        query, rank = sql_search(
+            Employee.query.join(Department, Employee.department_id == Department.id),
+            [Employee.firstname, Employee.lastname, Department.name], text)
+        return query, [rank.desc(), Employee.firstname, Employee.id], None
+
+    refresh(employees_index, load_employees_index)
+    return Employee.query, [], employees_index.matches(Employee, text, ('firstname',))
+
+
+def search_departments(text):
+    """Returns a Department query matching `text` against name and short_name,
+    plus the ordering that puts the best match first (or the index hits, as
+    in search_employees)."""
+    if uses_sql_search():
+        query, rank = sql_search(Department.query, [Department.name, Department.short_name], text)
+        return query, [rank.desc(), Department.name, Department.id], None
+
+    refresh(departments_index, load_departments_index)
+    return Department.query, [], departments_index.matches(Department, text, ('name',))
+
+
+def invalidate_search_index():
+    employees_index.clear()
+    departments_index.clear()
+
+
+def invalidate_employees_index():
+    # core statements (bulk inserts, set-based updates) skip the mapper
+    # events; they bump the version themselves, this reloads right away
+    employees_index.clear()
+
+
+# Keep the in-process index in step with ORM writes. Rows added by a
+# transaction that is later rolled back only leave ids that no longer exist,
+# which the database filters out when the results are fetched.
+#
+# Each write also bumps the table's version. When the index was current
+# before the write, it is current after the commit too, so it takes the new
+# version instead of reloading; versions bumped by rolled back transactions
+# are dropped.
+
+def track_versions(target, bumped):
+    session = db.inspect(target).session
+    if session is None or not bumped:
+        return
+    pending = session.info.setdefault('search_versions', {})
+    for name, version in bumped.items():
+        # keep the version before the transaction's first bump
+        first, _ = pending.get(name, (version - 1, None))
+        pending[name] = (first, version)
+
+
+@db.event.listens_for(Session, 'after_commit')
+def adopt_versions(session):
+    for name, (previous, version) in session.info.pop('search_versions', {}).items():
+        index = INDEXES[name]
+        with index.lock:
+            if index.loaded and index.version == previous:
+                index.version = version
+
+
+@db.event.listens_for(Session, 'after_rollback')
+def drop_versions(session):
+    session.info.pop('search_versions', None)
+
+
+@db.event.listens_for(Employee, 'after_insert')
+@db.event.listens_for(Employee, 'after_update')
+def index_employee(mapper, connection, employee):
+    track_versions(employee, bump_versions(connection, 'employees'))
+    if not employees_index.loaded:
+        return
+    department_name = connection.execute(
+        db.select(Department.name).where(Department.id == employee.department_id)).scalar()
+    employees_index.add(employee.id, (employee.firstname, employee.lastname, department_name),
+                        employee_record(employee.id, employee.firstname, employee.created_at))
+
+
+@db.event.listens_for(Employee, 'after_delete')
+def unindex_employee(mapper, connection, employee):
+    track_versions(employee, bump_versions(connection, 'employees'))
+    employees_index.remove(employee.id)
+
+
+@db.event.listens_for(Department, 'after_insert')
+def index_department(mapper, connection, department):
+    track_versions(department, bump_versions(connection, 'departments'))
+    if departments_index.loaded:
+        departments_index.add(department.id, (department.name, department.short_name),
+                              department_record(department.id, department.name))
+
+
+@db.event.listens_for(Department, 'after_update')
+def reindex_department(mapper, connection, department):
+    # employees are indexed with their department name, rebuild them lazily
+    track_versions(department, bump_versions(connection, 'departments', 'employees'))
+    if departments_index.loaded:
+        departments_index.add(department.id, (department.name, department.short_name),
+                              department_record(department.id, department.name))
+    employees_index.clear()
+
+
+@db.event.listens_for(Department, 'after_delete')
+def unindex_department(mapper, connection, department):
+    track_versions(department, bump_versions(connection, 'departments', 'employees'))
+    departments_index.remove(department.id)
+    employees_index.clear()
@@ -0,0 +1,82 @@
+"""Column projections and JSON encoding for the list endpoints.
+
+List routes without `?expand=` select only the columns they return, as plain
+rows instead of ORM objects, and encode them with orjson when it is
+installed. Datetimes keep the HTTP date format jsonify gives them, so a body
+is the same whichever path or encoder produced it.
+"""
+from datetime import date
+
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+from .metrics import timed_serialization
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# same keys and order as Employee.serialize() and Department.serialize()
+EMPLOYEE_FIELDS = ('id', 'firstname', 'lastname', 'age', 'image', 'is_active',
+                   'created_at', 'department_id', 'modified_at', 'deactivated_at')
+DEPARTMENT_FIELDS = ('id', 'name', 'short_name', 'created_at', 'modified_at')
+
+
+def parse_fields(args, allowed):
+    """Fields asked for with ?fields=a,b (all of `allowed` by default)."""
+    if 'fields' not in args:
+        return allowed
+
+    fields = tuple(dict.fromkeys(field.strip() for field in args['fields'].split(',') if field.strip()))
+    unknown = [field for field in fields if field not in allowed]
+    if not fields or unknown:
+        raise ValueError('fields must be some of: {}'.format(', '.join(allowed)))
+
+    return fields
+
+
+def project(model, fields, keys=()):
+    """Columns to select for `fields`, followed by the `keys` columns (the
+    pagination keys) that are not already among them."""
+    return [getattr(model, field) for field in fields] + [key for key in keys if key.key not in fields]
+
+
+def rows_as_dicts(rows, fields):
+    # rows start with the `fields` columns, zip drops the trailing keys
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def pick(item, fields, expand=()):
+    return {key: value for key, value in item.items() if key in fields or key in expand}
+
+
+def encode_default(value):
+    if isinstance(value, date):
+        return http_date(value)
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(value).__name__))
+
+
+def dumps(value):
+    """JSON bytes of `value`, sorted like jsonify sorts them."""
+    with timed_serialization():
+        if orjson is not None:
+            return orjson.dumps(value, default=encode_default,
+                                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SORT_KEYS)
+
+        return current_app.json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(value, status=200):
+    return current_app.response_class(dumps(value), status=status, mimetype='application/json')
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, with jsonify's encoding time counted in the
+    request's serialization metric."""
+
+    def dumps(self, obj, **kwargs):
+        with timed_serialization():
+            return super().dumps(obj, **kwargs)
@@ -0,0 +1,54 @@
+"""Cold start timing for the `flask startup-time` command.
+
+Each run starts a new interpreter, so module imports are paid again just like
+on a gunicorn worker boot, and reports how long importing the app, running
+create_app and serving the first request took.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+PHASES = ('import', 'create_app', 'first_request', 'total')
+
+BACKEND_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(started, database_path=None):
+    """Times one cold start of this interpreter, from `started` taken before
+    the first import of the app, and prints it as JSON."""
+    from app import create_app
+    imported = time.perf_counter()
+    app = create_app({'database_path': database_path} if database_path else None)
+    created = time.perf_counter()
+    app.test_client().get('/departments')
+    served = time.perf_counter()
+
+    print(json.dumps({
+        'import': imported - started,
+        'create_app': created - imported,
+        'first_request': served - created,
+        'total': served - started,
+    }))
+
+
+def run(runs, database_path=None):
+    """Median and max of each phase over `runs` cold starts, in milliseconds."""
+    script = ('import time; started = time.perf_counter(); '
+              'from app.startup import measure; measure(started, {!r})').format(database_path)
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', script], cwd=BACKEND_FOLDER,
+                                check=True, capture_output=True, text=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    return {
+        phase: {
+            'p50_ms': round(statistics.median(sample[phase] for sample in samples) * 1000, 1),
+            'max_ms': round(max(sample[phase] for sample in samples) * 1000, 1),
+        }
+        for phase in PHASES
+    }
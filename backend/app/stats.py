@@ -0,0 +1,233 @@
+"""Per-department summary behind GET /stats.
+
+`department_stats` keeps running totals per department. The mapper events
+below adjust them with relative UPDATEs (`employees = employees + 1`) on the
+flush's own connection, so they commit or roll back with the write and
+concurrent writers never overwrite each other; reading the stats is then
+O(departments). Core statements bypass mapper events: code that writes
+employees with them applies the deltas itself (`apply_employee_deltas`,
+`apply_employee_changes`). `rebuild()` recomputes everything with GROUP BY,
+for the migration and for `flask rebuild-stats`.
+"""
+from collections import defaultdict
+
+from .models import db, Employee, Department, File, DepartmentStats
+
+
+stats = DepartmentStats.__table__
+
+COUNTERS = ('employees', 'active_employees', 'age_total', 'files')
+
+
+def apply_delta(connection, department_id, **deltas):
+    """Adds `deltas` (counter name -> amount) to a department's row,
+    creating the row when it is missing. `connection` may be a session."""
+    deltas = {name: amount for name, amount in deltas.items() if amount}
+    if not deltas or department_id is None:
+        return
+
+    result = connection.execute(
+        db.update(stats).where(stats.c.department_id == department_id)
+        .values({name: stats.c[name] + amount for name, amount in deltas.items()}))
+    if result.rowcount == 0:
+        connection.execute(db.insert(stats).values(
+            department_id=department_id, **{name: deltas.get(name, 0) for name in COUNTERS}))
+
+
+def move_files(connection, employee_id, amount_sign, department_id):
+    # adds (or with -1 removes) all the employee's files to a department
+    files = db.select(db.func.count(File.id)).where(File.employee_id == employee_id).scalar_subquery()
+    connection.execute(
+        db.update(stats).where(stats.c.department_id == department_id)
+        .values(files=stats.c.files + amount_sign * files))
+
+
+def employee_counters(department_id, is_active, age):
+    return department_id, {
+        'employees': 1,
+        'active_employees': 1 if is_active else 0,
+        'age_total': int(age or 0),
+    }
+
+
+def add_counters(totals, rows, sign):
+    for row in rows:
+        department_id, counters = employee_counters(
+            row['department_id'], row.get('is_active', True), row.get('age'))
+        counters['files'] = row.get('files', 0)
+        for name, amount in counters.items():
+            totals[department_id][name] += sign * amount
+
+
+def apply_totals(connection, totals):
+    """Applies deltas for many departments with one executemany UPDATE,
+    inserting the rows of departments that have none yet."""
+    params = [dict(department=department_id, **{'delta_' + name: deltas[name] for name in COUNTERS})
+              for department_id, deltas in totals.items()
+              if department_id is not None and any(deltas.values())]
+    if not params:
+        return
+
+    result = connection.execute(
+        db.update(stats).where(stats.c.department_id == db.bindparam('department'))
+        .values({name: stats.c[name] + db.bindparam('delta_' + name) for name in COUNTERS}), params)
+    if result.rowcount >= len(params):
+        return
+
+    existing = set(connection.execute(
+        db.select(stats.c.department_id)
+        .where(stats.c.department_id.in_([param['department'] for param in params]))).scalars())
+    missing = [dict(department_id=param['department'], **{name: param['delta_' + name] for name in COUNTERS})
+               for param in params if param['department'] not in existing]
+    if missing:
+        connection.execute(db.insert(stats), missing)
+
+
+def apply_employee_deltas(connection, rows, sign=1):
+    """Core inserts (sign 1) or deletes (sign -1) of employee rows; a row's
+    optional 'files' key is the number of files going with it."""
+    totals = defaultdict(lambda: defaultdict(int))
+    add_counters(totals, rows, sign)
+    apply_totals(connection, totals)
+
+
+def apply_employee_changes(connection, before, after):
+    """Core updates: the affected rows as they were and as they are now."""
+    totals = defaultdict(lambda: defaultdict(int))
+    add_counters(totals, before, -1)
+    add_counters(totals, after, 1)
+    apply_totals(connection, totals)
+
+
+def committed(target, key):
+    """Value of `key` before the changes being flushed."""
+    history = db.inspect(target).attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(target, key)
+
+
+@db.event.listens_for(Employee, 'after_insert')
+def count_employee(mapper, connection, employee):
+    department_id, counters = employee_counters(employee.department_id, employee.is_active, employee.age)
+    apply_delta(connection, department_id, **counters)
+
+
+@db.event.listens_for(Employee, 'after_update')
+def recount_employee(mapper, connection, employee):
+    old_department, old = employee_counters(
+        committed(employee, 'department_id'), committed(employee, 'is_active'), committed(employee, 'age'))
+    new_department, new = employee_counters(employee.department_id, employee.is_active, employee.age)
+
+    if old_department == new_department:
+        apply_delta(connection, new_department, **{name: new[name] - old[name] for name in new})
+        return
+
+    apply_delta(connection, old_department, **{name: -amount for name, amount in old.items()})
+    apply_delta(connection, new_department, **new)
+    move_files(connection, employee.id, -1, old_department)
+    move_files(connection, employee.id, 1, new_department)
+
+
+@db.event.listens_for(Employee, 'after_delete')
+def uncount_employee(mapper, connection, employee):
+    department_id, counters = employee_counters(
+        committed(employee, 'department_id'), committed(employee, 'is_active'), committed(employee, 'age'))
+    apply_delta(connection, department_id, **{name: -amount for name, amount in counters.items()})
+
+
+def count_file(connection, employee_id, amount):
+    department_id = db.select(Employee.department_id).where(Employee.id == employee_id).scalar_subquery()
+    connection.execute(
+        db.update(stats).where(stats.c.department_id == department_id)
+        .values(files=stats.c.files + amount))
+
+
+@db.event.listens_for(File, 'after_insert')
+def count_upload(mapper, connection, file):
+    count_file(connection, file.employee_id, 1)
+
+
+@db.event.listens_for(File, 'after_delete')
+def uncount_upload(mapper, connection, file):
+    count_file(connection, committed(file, 'employee_id'), -1)
+
+
+@db.event.listens_for(Department, 'after_insert')
+def add_department(mapper, connection, department):
+    connection.execute(db.insert(stats).values(
+        department_id=department.id, **{name: 0 for name in COUNTERS}))
+
+
+@db.event.listens_for(Department, 'after_delete')
+def remove_department(mapper, connection, department):
+    # ON DELETE CASCADE already does this where foreign keys are enforced
+    connection.execute(db.delete(stats).where(stats.c.department_id == department.id))
+
+
+def rebuild(connection):
+    """Recomputes every row with GROUP BY. Writes committed while it runs
+    can be lost, so run it when the API is idle."""
+    totals = {department_id: dict.fromkeys(COUNTERS, 0)
+              for department_id in connection.execute(db.select(Department.id)).scalars()}
+
+    employees = connection.execute(
+        db.select(Employee.department_id,
+                  db.func.count(Employee.id),
+                  db.func.sum(db.case((Employee.is_active, 1), else_=0)),
+                  db.func.coalesce(db.func.sum(Employee.age), 0))
+        .group_by(Employee.department_id))
+    for department_id, count, active, age_total in employees:
+        if department_id in totals:
+            totals[department_id].update(employees=count, active_employees=active, age_total=age_total)
+
+    files = connection.execute(
+        db.select(Employee.department_id, db.func.count(File.id))
+        .join(Employee, File.employee_id == Employee.id)
+        .group_by(Employee.department_id))
+    for department_id, count in files:
+        if department_id in totals:
+            totals[department_id]['files'] = count
+
+    connection.execute(db.delete(stats))
+    if totals:
+        connection.execute(db.insert(stats), [
+            dict(department_id=department_id, **counters) for department_id, counters in totals.items()])
+
+
+def average(total, count):
+    return round(total / count, 2) if count else None
+
+
+def summarize(counters):
+    return {
+        'employees': counters['employees'],
+        'active_employees': counters['active_employees'],
+        'inactive_employees': counters['employees'] - counters['active_employees'],
+        'average_age': average(counters['age_total'], counters['employees']),
+        'files': counters['files'],
+        'files_per_employee': average(counters['files'], counters['employees']),
+    }
+
+
+def read_stats():
+    """Totals over the active departments plus one entry per department,
+    from the summary rows only."""
+    rows = db.session.execute(
+        db.select(Department.id, Department.name, Department.short_name,
+                  *[db.func.coalesce(stats.c[name], 0).label(name) for name in COUNTERS])
+        .outerjoin(stats, stats.c.department_id == Department.id)
+        .where(Department.is_active)
+        .order_by(Department.name, Department.id)).all()
+
+    totals = dict.fromkeys(COUNTERS, 0)
+    departments = []
+    for row in rows:
+        counters = {name: getattr(row, name) for name in COUNTERS}
+        for name in COUNTERS:
+            totals[name] += counters[name]
+        departments.append(dict(id=row.id, name=row.name, short_name=row.short_name, **summarize(counters)))
+
+    return dict(departments=len(departments), **summarize(totals)), departments
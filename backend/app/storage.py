@@ -0,0 +1,98 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+from flask import Request, current_app, request, send_file
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+class HashingFile:
+    """Temporary file in the blob folder that hashes every chunk the
+    multipart parser writes, so the upload is on disk and its SHA-256 is
+    known as soon as the body has been read."""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.file = tempfile.NamedTemporaryFile(dir=directory, prefix='upload-', delete=False)
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.committed = False
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def close(self):
+        self.file.close()
+        if not self.committed and os.path.exists(self.file.name):
+            os.unlink(self.file.name)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def __iter__(self):
+        return iter(self.file)
+
+
+class UploadRequest(Request):
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingFile(os.path.join(blob_folder(), 'tmp'))
+
+
+def blob_folder():
+    return os.path.abspath(current_app.config['BLOB_FOLDER'])
+
+
+def blob_path(content_hash):
+    return os.path.join(blob_folder(), content_hash[:2], content_hash)
+
+
+def commit_blob(file_storage):
+    """Moves an uploaded file to its content address and returns
+    (content_hash, size). A blob that is already stored is not written
+    again."""
+    stream = file_storage.stream
+    if not isinstance(stream, HashingFile):
+        # uploads that did not go through UploadRequest, copy them once
+        copy = HashingFile(os.path.join(blob_folder(), 'tmp'))
+        stream.seek(0)
+        shutil.copyfileobj(stream, copy, CHUNK_SIZE)
+        stream = copy
+
+    stream.flush()
+    content_hash = stream.sha256.hexdigest()
+    path = blob_path(content_hash)
+
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(stream.name, path)
+        stream.committed = True
+
+    stream.close()
+    return content_hash, stream.size
+
+
+def send_blob(path, mimetype, etag, max_age):
+    """Serves a file under the blob folder with a strong ETag, Range and
+    conditional request support. With X_ACCEL_REDIRECT_PREFIX set nginx
+    sends the bytes; otherwise send_file hands the open file to the
+    server's wsgi.file_wrapper (sendfile under gunicorn) or emits
+    X-Sendfile when USE_X_SENDFILE is on."""
+    prefix = current_app.config.get('X_ACCEL_REDIRECT_PREFIX')
+    if not prefix:
+        response = send_file(path, mimetype=mimetype, etag=etag, max_age=max_age, conditional=True)
+    else:
+        response = current_app.response_class(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = '{}/{}'.format(
+            prefix.rstrip('/'), os.path.relpath(path, blob_folder()).replace(os.sep, '/'))
+        response.set_etag(etag)
+        response.cache_control.max_age = max_age
+        response = response.make_conditional(request)
+
+    response.cache_control.private = True
+    return response
@@ -0,0 +1,80 @@
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from config import config
+
+
+logger = logging.getLogger(__name__)
+
+SIZES = tuple(config.get('THUMBNAIL_SIZES', (64, 256)))
+
+FORMAT_EXTENSIONS = {'PNG': 'png', 'JPEG': 'jpg', 'GIF': 'gif'}
+
+MIMETYPES = {'webp': 'image/webp', 'png': 'image/png', 'jpg': 'image/jpeg', 'gif': 'image/gif'}
+
+executor = ThreadPoolExecutor(max_workers=config.get('THUMBNAIL_WORKERS', 2),
+                              thread_name_prefix='thumbnails')
+
+
+def derivative_path(blob_folder, content_hash, size, extension):
+    return os.path.join(blob_folder, 'derivatives', content_hash[:2],
+                        '{}_{}.{}'.format(content_hash, size, extension))
+
+
+def save_atomically(image, path, image_format):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as tmp:
+        image.save(tmp, image_format)
+    os.replace(tmp.name, path)
+
+
+def generate_derivatives(blob_folder, content_hash):
+    """Writes a WebP and an original format thumbnail of the blob for every
+    size in SIZES. Derivatives that already exist are kept."""
+    # Pillow is imported on the first upload rather than on every worker boot
+    from PIL import Image
+
+    source = os.path.join(blob_folder, content_hash[:2], content_hash)
+    try:
+        with Image.open(source) as original:
+            extension = FORMAT_EXTENSIONS.get(original.format, 'png')
+            original_format = original.format if original.format in FORMAT_EXTENSIONS else 'PNG'
+
+            for size in SIZES:
+                webp = derivative_path(blob_folder, content_hash, size, 'webp')
+                same_format = derivative_path(blob_folder, content_hash, size, extension)
+                if os.path.exists(webp) and os.path.exists(same_format):
+                    continue
+
+                thumbnail = original.copy()
+                thumbnail.thumbnail((size, size))
+                if thumbnail.mode not in ('RGB', 'RGBA'):
+                    thumbnail = thumbnail.convert('RGBA')
+                if original_format == 'JPEG':
+                    thumbnail = thumbnail.convert('RGB')
+
+                save_atomically(thumbnail, webp, 'WEBP')
+                save_atomically(thumbnail, same_format, original_format)
+    except Exception:
+        logger.exception('Error generating thumbnails for %s', content_hash)
+
+
+def schedule_derivatives(blob_folder, content_hash):
+    return executor.submit(generate_derivatives, blob_folder, content_hash)
+
+
+def find_derivative(blob_folder, content_hash, size, accept_webp):
+    """Returns (path, mimetype) of the best stored derivative or None when it
+    has not been generated yet."""
+    derivatives = os.path.join(blob_folder, 'derivatives', content_hash[:2])
+    candidates = ['webp'] if accept_webp else []
+    candidates += list(FORMAT_EXTENSIONS.values())
+
+    for extension in candidates:
+        path = os.path.join(derivatives, '{}_{}.{}'.format(content_hash, size, extension))
+        if os.path.exists(path):
+            return path, MIMETYPES[extension]
+
+    return None
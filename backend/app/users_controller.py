@@ -3,19 +3,57 @@ from flask import (
     request,
     jsonify,
     abort,
-    Response
+    g
 )
 
 import jwt
+import time
+import uuid
 import datetime
+import logging
 
-from .models import User
-from config.local import config
+from .models import db, User
+from .passwords import HashingBusy, hash_password, verify_password, needs_rehash
+from .authentication import authorize, token_cache, revocations
+from .query_audit import query_budget
+from config import config
+
+logger = logging.getLogger(__name__)
 
 users_bp = Blueprint('/users', __name__)
 
 
+def token_lifetime(type='access'):
+    if type == 'refresh':
+        return datetime.timedelta(days=config.get('REFRESH_TOKEN_DAYS', 14))
+    return datetime.timedelta(minutes=config.get('ACCESS_TOKEN_MINUTES', 15))
+
+
+def create_token(user_id, type='access'):
+    return jwt.encode({
+        'user_created_id': user_id,
+        'jti': str(uuid.uuid4()),
+        'type': type,
+        'exp': datetime.datetime.utcnow() + token_lifetime(type)
+    }, config['SECRET_KEY'], config['ALGORYTHM'])
+
+
+def decode_refresh_token(token):
+    """Payload of a valid, not revoked refresh token, None otherwise."""
+    try:
+        payload = jwt.decode(token, config['SECRET_KEY'], config['ALGORYTHM'])
+    except Exception as e:
+        logger.info('Rejected refresh token: %s', e)
+        return None
+
+    if payload.get('type') != 'refresh' or revocations.is_revoked(payload.get('jti')):
+        return None
+
+    return payload
+
+
 @users_bp.route('/users', methods=['POST'])
+@query_budget(4)
 def create_user():
     error_lists = []
     returned_code = 201
@@ -54,16 +92,17 @@ def create_user():
         if len(error_lists) > 0:
             returned_code = 400
         else:
-            user = User(username=username, password=password)
+            user = User(username=username, password_hash=hash_password(password))
             user_created_id = user.insert()
 
-            token = jwt.encode({
-                'user_created_id': user_created_id,
-                'exp': datetime.datetime.utcnow() + datetime.timedelta(minutes=30)
-            }, config['SECRET_KEY'], config['ALGORYTHM'])
+            token = create_token(user_created_id)
+            refresh_token = create_token(user_created_id, 'refresh')
+
+    except HashingBusy:
+        returned_code = 503
 
     except Exception as e:
-        print('e: ', e)
+        logger.exception('Error creating user')
         returned_code = 500
 
     if returned_code == 400:
@@ -78,17 +117,168 @@ def create_user():
         return jsonify({
             'success': True,
             'token': token,
+            'refresh_token': refresh_token,
             'user_created_id': user_created_id,
         }), returned_code
 
 
 
 @users_bp.route('/api/signin', methods=['POST'])
+@query_budget(3)
 def login():
-    pass
+    error_lists = []
+    returned_code = 200
+    try:
+        body = request.get_json(silent=True) or {}
+
+        if 'username' not in body:
+            error_lists.append('username is required')
+
+        if 'password' not in body:
+            error_lists.append('password is required')
+
+        if len(error_lists) > 0:
+            returned_code = 400
+        else:
+            user = User.query.filter(User.username == body['username']).first()
+
+            if user is None or not verify_password(user.password_hash, body['password']):
+                returned_code = 401
+            else:
+                if needs_rehash(user.password_hash):
+                    user.password_hash = hash_password(body['password'])
+                    db.session.commit()
+
+                user_id = user.id
+                token = create_token(user_id)
+                refresh_token = create_token(user_id, 'refresh')
+
+    except HashingBusy:
+        returned_code = 503
+
+    except Exception as e:
+        logger.exception('Error signing in')
+        db.session.rollback()
+        returned_code = 500
+
+    finally:
+        db.session.close()
+
+    if returned_code == 400:
+        return jsonify({
+            'success': False,
+            'errors': error_lists,
+            'message': 'Error signing in'
+        }), returned_code
+    elif returned_code == 401:
+        return jsonify({
+            'success': False,
+            'message': 'Invalid username or password'
+        }), returned_code
+    elif returned_code != 200:
+        abort(returned_code)
+    else:
+        return jsonify({
+            'success': True,
+            'token': token,
+            'refresh_token': refresh_token,
+            'user_id': user_id,
+        }), returned_code
+
+
+@users_bp.route('/api/refresh', methods=['POST'])
+@query_budget(3)
+def refresh():
+    returned_code = 200
+    try:
+        body = request.get_json(silent=True) or {}
+
+        if 'refresh_token' not in body:
+            returned_code = 400
+        else:
+            payload = decode_refresh_token(body['refresh_token'])
+
+            if payload is None or db.session.get(User, payload['user_created_id']) is None:
+                returned_code = 401
+            elif not revocations.revoke(payload['jti'], payload['exp']):
+                # Refresh tokens are single use: of concurrent requests with
+                # the same token only the one that revoked it gets new tokens.
+                returned_code = 401
+            else:
+                user_id = payload['user_created_id']
+                token = create_token(user_id)
+                refresh_token = create_token(user_id, 'refresh')
+
+    except Exception as e:
+        logger.exception('Error refreshing token')
+        returned_code = 500
+
+    finally:
+        db.session.close()
+
+    if returned_code == 400:
+        return jsonify({
+            'success': False,
+            'errors': ['refresh_token is required'],
+            'message': 'Error refreshing token'
+        }), returned_code
+    elif returned_code == 401:
+        return jsonify({
+            'success': False,
+            'message': 'Invalid refresh token, sign in again'
+        }), returned_code
+    elif returned_code != 200:
+        abort(returned_code)
+    else:
+        return jsonify({
+            'success': True,
+            'token': token,
+            'refresh_token': refresh_token,
+            'user_id': user_id,
+        }), returned_code
+
+
+@users_bp.route('/api/signout', methods=['POST'])
+@query_budget(3)
+@authorize
+def signout():
+    returned_code = 200
+    try:
+        body = request.get_json(silent=True) or {}
+
+        if 'jti' in g.token:
+            revocations.revoke(g.token['jti'], g.token['exp'])
+
+        if 'refresh_token' in body:
+            payload = decode_refresh_token(body['refresh_token'])
+            if payload is not None and payload['user_created_id'] == g.token['user_created_id']:
+                revocations.revoke(payload['jti'], payload['exp'])
+
+    except Exception as e:
+        logger.exception('Error signing out')
+        returned_code = 500
+
+    if returned_code != 200:
+        abort(returned_code)
+    else:
+        return jsonify({
+            'success': True
+        }), returned_code
+
+
+@users_bp.route('/api/token-cache', methods=['GET'])
+@query_budget(0)
+@authorize
+def get_token_cache_stats():
+    return jsonify({
+        'success': True,
+        'token_cache': token_cache.stats(),
+        'revocations': revocations.stats()
+    })
 
 
 @users_bp.route('/users/<user_id>', methods=['DELETE'])
+@query_budget(3)
 def delete_user(user_id):
     returned_code = 200   
 
@@ -96,10 +286,17 @@ def delete_user(user_id):
         user = User.query.get(user_id) 
         if user is None:
             returned_code = 404
+        else:
+            # outlives every token the user still holds, on every worker
+            longest = max(token_lifetime('access'), token_lifetime('refresh'))
+            revocations.delete_user(user_id, int(time.time() + longest.total_seconds()))
 
-        user.delete()
+            db.session.delete(user)
+            db.session.commit()
+            token_cache.invalidate_user(user_id)
     except Exception as e:
-        print('\te: ', e)
+        logger.exception('Error deleting user')
+        db.session.rollback()
         returned_code = 500
 
     if returned_code != 200:
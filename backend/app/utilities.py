@@ -1,5 +1,34 @@
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
+EMPLOYEE_REQUIRED_FIELDS = [
+    ('firstname', 'firstname is required'),
+    ('lastname', 'lastname is required'),
+    ('age', 'age is required'),
+    ('selectDepartment', 'department is required'),
+]
+
 def allowed_file(filename):
     return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
\ No newline at end of file
+           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def validate_employee(body):
+    return [message for field, message in EMPLOYEE_REQUIRED_FIELDS
+            if field not in body]
+
+
+def parse_expand(args, allowed):
+    expand = [relation.strip() for relation in args.get('expand', '').split(',')
+              if relation.strip()]
+
+    unknown = [relation for relation in expand if relation not in allowed]
+    if unknown:
+        raise ValueError('expand must be one of: {}'.format(', '.join(sorted(allowed))))
+
+    return set(expand)
+
+
+def parse_status(args, allowed):
+    status = args.get('status', 'active')
+    if status not in allowed:
+        raise ValueError('status must be one of: {}'.format(', '.join(allowed)))
+    return status
@@ -0,0 +1,92 @@
+"""Throughput of GET /employees when every request writes a log line.
+
+`print` reproduces the old authorize behaviour: an unbuffered write to stdout
+inside the request thread. `queue` emits the same line through the app's
+QueueHandler, so the write happens on the QueueListener thread.
+
+    cd backend
+    python -m benchmarks.bench_logging --requests 2000 --employees 200
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import request
+
+from app import create_app, log
+from app.models import db, Department, Employee
+
+
+def seed(app, client, employees):
+    response = client.post('/users', json={
+        'username': 'bench-{}'.format(int(time.time() * 1000)),
+        'password': 'benchmark-password',
+        'confirmationPassword': 'benchmark-password',
+    })
+
+    with app.app_context():
+        department = Department('Benchmark', 'BM')
+        db.session.add(department)
+        db.session.flush()
+        db.session.add_all([Employee('first{}'.format(i), 'last{}'.format(i), 30, department.id)
+                            for i in range(employees)])
+        db.session.commit()
+
+    return json.loads(response.data)['token']
+
+
+def run(client, token, requests):
+    started = time.perf_counter()
+    for _ in range(requests):
+        client.get('/employees', headers={'X-ACCESS-TOKEN': token})
+    return requests / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--employees', type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    app = create_app({'database_path': 'sqlite:///' + os.path.join(workdir, 'bench.db')})
+    client = app.test_client()
+    sink = open(os.path.join(workdir, 'requests.log'), 'w', buffering=1)
+
+    mode = {'value': None}
+    logger = logging.getLogger('app.benchmark')
+    logger.setLevel(logging.INFO)
+    log.listener.handlers = (logging.StreamHandler(sink),)
+
+    @app.before_request
+    def log_token():
+        if mode['value'] == 'print':
+            print('authentication token: ', request.headers.get('X-ACCESS-TOKEN'), file=sink, flush=True)
+        elif mode['value'] == 'queue':
+            logger.info('authentication token: %s', request.headers.get('X-ACCESS-TOKEN'))
+
+    token = seed(app, client, args.employees)
+
+    results = {}
+    for name in ('print', 'queue'):
+        mode['value'] = name
+        run(client, token, args.requests // 10)
+        results[name] = run(client, token, args.requests)
+
+    print(json.dumps({
+        'route': 'GET /employees',
+        'requests': args.requests,
+        'employees': args.employees,
+        'requests_per_second': {name: round(value, 1) for name, value in results.items()},
+        'speedup': round(results['queue'] / results['print'], 3),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Micro-benchmarks for the per-row and per-request helpers.
+
+    cd backend
+    python -m benchmarks.bench_micro --output micro.json
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jwt
+
+from app import create_app
+from app.authentication import authorize, token_cache
+from app.models import Department, Employee
+from app.utilities import allowed_file
+from config import config
+
+
+def per_call(statement, number, repeat=5):
+    """Best of `repeat` runs, in microseconds per call."""
+    return round(min(timeit.repeat(statement, number=number, repeat=repeat)) / number * 1e6, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=10000)
+    parser.add_argument('--output', help='write the JSON results to this file')
+    args = parser.parse_args()
+
+    employee = Employee('gustavo', 'gutierrez', 20, 'eef11f69-ffe9-4078-ad09-16e31fe7f77c')
+    employee.department = Department('Recursos Humanos', 'RRHH')
+
+    token = jwt.encode({
+        'user_created_id': 'benchmark',
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(minutes=30)
+    }, config['SECRET_KEY'], config['ALGORYTHM'])
+
+    # authorize checks revocations through the database, so it needs a real app
+    database = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = create_app({'database_path': database})
+    protected = authorize(lambda: None)
+
+    def call_authorize():
+        with app.test_request_context('/', headers={'X-ACCESS-TOKEN': token}):
+            protected()
+
+    def call_authorize_uncached():
+        token_cache.tokens.clear()
+        call_authorize()
+
+    results = {
+        'employee_serialize_us': per_call(employee.serialize, args.number),
+        'employee_serialize_expand_us': per_call(lambda: employee.serialize({'department', 'files'}), args.number),
+        'authorize_cached_us': per_call(call_authorize, args.number // 10),
+        'authorize_uncached_us': per_call(call_authorize_uncached, args.number // 10),
+        'allowed_file_us': per_call(lambda: allowed_file('courtois.JPEG'), args.number * 10),
+    }
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""Latency and throughput of every route of the API.
+
+Seeds a database at the requested scale, then sends `--requests` requests
+to each route through the Flask test client and reports p50/p99 latency and
+requests per second as JSON. Routes that consume their target (DELETE, the
+user routes) get a fresh one before each timed request.
+
+    cd backend
+    python -m benchmarks.bench_routes --scale 100k --output results.json
+    python -m benchmarks.bench_routes --database postgresql://marvin@localhost:5432/benchdb
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.cache import response_cache
+from benchmarks.seed import parse_scale, seed
+
+
+with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'static', 'testImages', 'test.png'), 'rb') as image:
+    IMAGE = image.read()
+
+
+class Context:
+
+    def __init__(self, client, department_ids, employee_ids):
+        self.client = client
+        self.department_ids = department_ids
+        self.employee_ids = employee_ids
+        self.token = self.new_user()[1]
+        self.login = {'username': self.username, 'password': 'benchmark-password'}
+        response = self.client.post('/files', data={'employee_id': employee_ids[0],
+                                                    'image': (io.BytesIO(IMAGE), 'test.png')},
+                                    content_type='multipart/form-data', headers=self.headers)
+        self.file_id = json.loads(response.data)['file']['id']
+
+    @property
+    def headers(self):
+        return {'X-ACCESS-TOKEN': self.token}
+
+    def new_user(self):
+        self.username = uuid.uuid4().hex[:20]
+        response = self.client.post('/users', json={
+            'username': self.username,
+            'password': 'benchmark-password',
+            'confirmationPassword': 'benchmark-password',
+        })
+        data = json.loads(response.data)
+        return data['user_created_id'], data['token']
+
+    def new_session(self):
+        data = json.loads(self.client.post('/api/signin', json=self.login).data)
+        return data['token'], data['refresh_token']
+
+    def new_department(self):
+        response = self.client.post('/departments', json={'name': 'Benchmark', 'short_name': 'BM'},
+                                    headers=self.headers)
+        return json.loads(response.data)['department']['id']
+
+    def new_employee(self):
+        response = self.client.post('/employees', json=self.employee(), headers=self.headers)
+        return json.loads(response.data)['id']
+
+    def new_employees(self, count):
+        response = self.client.post('/employees/bulk', json=[self.employee() for _ in range(count)],
+                                    headers=self.headers)
+        return [created['id'] for created in json.loads(response.data)['created']]
+
+    def employee(self):
+        return {
+            'firstname': 'bench',
+            'lastname': 'mark',
+            'age': 30,
+            'selectDepartment': self.department_ids[0],
+        }
+
+
+def uncached(ctx, path):
+    def build():
+        response_cache.invalidate('employees', 'departments', 'files')
+        return 'GET', path, {'headers': ctx.headers}
+    return build
+
+
+def route_requests(ctx):
+    """One factory per endpoint; each returns (method, path, client kwargs)."""
+    return {
+        'create_employee': lambda: ('POST', '/employees', {'json': ctx.employee(), 'headers': ctx.headers}),
+        'create_employees_bulk': lambda: ('POST', '/employees/bulk', {
+            'json': [ctx.employee() for _ in range(100)], 'headers': ctx.headers}),
+        'upload_image': lambda: ('POST', '/files', {
+            'data': {'employee_id': ctx.employee_ids[0], 'image': (io.BytesIO(IMAGE), 'test.png')},
+            'content_type': 'multipart/form-data', 'headers': ctx.headers}),
+        'create_department': lambda: ('POST', '/departments', {
+            'json': {'name': 'Benchmark', 'short_name': 'BM'}, 'headers': ctx.headers}),
+        'get_employees': uncached(ctx, '/employees?limit=50'),
+        'get_employee_image': lambda: ('GET', '/employees/{}/image?size=64'.format(ctx.employee_ids[0]), {
+            'headers': dict(ctx.headers, Accept='image/webp')}),
+        'get_file': lambda: ('GET', '/files/' + ctx.file_id, {'headers': ctx.headers}),
+        'export_employees': lambda: ('GET', '/employees/export?format=ndjson', {'headers': ctx.headers}),
+        'update_department': lambda: ('PATCH', '/departments/' + ctx.department_ids[1], {
+            'json': {'short_name': 'UP'}, 'headers': ctx.headers}),
+        'delete_department': lambda: ('DELETE', '/departments/' + ctx.new_department(), {'headers': ctx.headers}),
+        'delete_employee': lambda: ('DELETE', '/employees/' + ctx.new_employee(), {'headers': ctx.headers}),
+        'update_employee': lambda: ('PATCH', '/employees/' + ctx.employee_ids[0], {
+            'data': {'age': '31', 'selectDepartment': ctx.department_ids[0],
+                     'image': (io.BytesIO(IMAGE), 'test.png')},
+            'content_type': 'multipart/form-data', 'headers': ctx.headers}),
+        'update_employees_batch': lambda: ('PATCH', '/employees', {
+            'json': {'ids': ctx.employee_ids[:100], 'set': {'selectDepartment': ctx.department_ids[1]}},
+            'headers': ctx.headers}),
+        'delete_employees_batch': lambda: ('DELETE', '/employees', {
+            'json': {'ids': ctx.new_employees(100)}, 'headers': ctx.headers}),
+        'get_departments': uncached(ctx, '/departments?limit=50'),
+        'get_pool_stats': lambda: ('GET', '/api/pool', {'headers': ctx.headers}),
+        'get_stats': lambda: ('GET', '/stats', {'headers': ctx.headers}),
+        'get_metrics': lambda: ('GET', '/metrics', {}),
+        'create_user': lambda: ('POST', '/users', {'json': {
+            'username': uuid.uuid4().hex[:20],
+            'password': 'benchmark-password',
+            'confirmationPassword': 'benchmark-password'}}),
+        'login': lambda: ('POST', '/api/signin', {'json': ctx.login}),
+        'refresh': lambda: ('POST', '/api/refresh', {'json': {'refresh_token': ctx.new_session()[1]}}),
+        'signout': lambda: ('POST', '/api/signout', {'headers': {'X-ACCESS-TOKEN': ctx.new_session()[0]}}),
+        'get_token_cache_stats': lambda: ('GET', '/api/token-cache', {'headers': ctx.headers}),
+        'delete_user': lambda: ('DELETE', '/users/' + ctx.new_user()[0], {}),
+    }
+
+
+def variant_requests(ctx):
+    """Variants worth tracking besides the plain route."""
+    return {
+        'get_employees_cached': lambda: ('GET', '/employees?limit=50', {'headers': ctx.headers}),
+        'get_employees_search': uncached(ctx, '/employees?search=gus&limit=50'),
+        'get_employees_search_all': uncached(ctx, '/employees?search=gus'),
+        'get_employees_expand': uncached(ctx, '/employees?limit=50&expand=department,files'),
+        'get_employees_fields': uncached(ctx, '/employees?limit=50&fields=id,firstname,lastname'),
+        'preflight_employees': lambda: ('OPTIONS', '/employees', {'headers': {
+            'Origin': 'http://localhost:8080', 'Access-Control-Request-Method': 'POST'}}),
+        'get_employees_gzip': lambda: ('GET', '/employees?limit=500', {
+            'headers': dict(ctx.headers, **{'Accept-Encoding': 'gzip'})}),
+    }
+
+
+def percentile(latencies, value):
+    if len(latencies) < 2:
+        return latencies[0]
+    return statistics.quantiles(latencies, n=100, method='inclusive')[value - 1]
+
+
+def measure(client, build, requests):
+    adapter = client.application.url_map.bind('localhost')
+    latencies = []
+    errors = 0
+    for _ in range(requests):
+        method, path, kwargs = build()
+        started = time.perf_counter()
+        response = client.open(path, method=method, **kwargs)
+        response.get_data()
+        latencies.append(time.perf_counter() - started)
+        if response.status_code >= 500:
+            errors += 1
+
+    rule, _ = adapter.match(path.split('?')[0], method=method, return_rule=True)
+
+    return {
+        'method': method,
+        'path': rule.rule,
+        'requests': requests,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'requests_per_second': round(requests / sum(latencies), 1),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', default='1k', help='employees to seed: 1k, 100k, 1m or a number')
+    parser.add_argument('--departments', type=int, default=50)
+    parser.add_argument('--files-per-employee', type=int, default=1)
+    parser.add_argument('--database', help='database URI, defaults to a temporary SQLite file')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--routes', help='comma separated subset of routes to run')
+    parser.add_argument('--output', help='write the JSON results to this file')
+    args = parser.parse_args()
+
+    commit = git_commit()
+    workdir = tempfile.mkdtemp()
+    database = args.database or 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    # uploads land in static/employees relative to the working directory
+    os.chdir(workdir)
+
+    app = create_app({'database_path': database})
+    client = app.test_client()
+    employees = parse_scale(args.scale)
+
+    with app.app_context():
+        started = time.perf_counter()
+        department_ids, employee_ids = seed(employees, args.departments, args.files_per_employee)
+        seed_seconds = time.perf_counter() - started
+
+    ctx = Context(client, department_ids, employee_ids)
+    builders = route_requests(ctx)
+
+    endpoints = {rule.endpoint for rule in app.url_map.iter_rules()} - {'static'}
+    missing = sorted(endpoint.split('.')[-1] for endpoint in endpoints
+                     if endpoint.split('.')[-1] not in builders)
+    if missing:
+        parser.error('no benchmark request for: {}'.format(', '.join(missing)))
+
+    builders.update(variant_requests(ctx))
+    if args.routes:
+        builders = {name: builders[name] for name in args.routes.split(',')}
+
+    results = {
+        'commit': commit,
+        'python': platform.python_version(),
+        'database': database.split(':')[0],
+        'employees': employees,
+        'departments': args.departments,
+        'seed_seconds': round(seed_seconds, 3),
+        'routes': {name: measure(client, build, args.requests) for name, build in builders.items()},
+    }
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Employee list serialization: ORM objects + serialize() + jsonify against
+column rows + orjson (and its stdlib fallback), over the whole table.
+
+    cd backend
+    python -m benchmarks.bench_serialization --scale 100k --output serialization.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import jsonify
+
+from app import create_app, serialization
+from app.models import db, Employee
+from app.serialization import EMPLOYEE_FIELDS, project, rows_as_dicts, dumps
+from benchmarks.seed import parse_scale, seed
+
+
+ORDER = (Employee.created_at, Employee.id)
+
+
+def orm_jsonify():
+    employees = Employee.query.order_by(*ORDER).all()
+    return jsonify({'success': True, 'employees': [employee.serialize() for employee in employees]}).get_data()
+
+
+def rows_dumps(fields=EMPLOYEE_FIELDS):
+    rows = db.session.execute(db.select(*project(Employee, fields)).order_by(*ORDER)).all()
+    return dumps({'success': True, 'employees': rows_as_dicts(rows, fields)})
+
+
+def rows_dumps_stdlib():
+    orjson, serialization.orjson = serialization.orjson, None
+    try:
+        return rows_dumps()
+    finally:
+        serialization.orjson = orjson
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        # a fresh session each run, so the ORM path cannot reuse the identity map
+        db.session.remove()
+        started = time.perf_counter()
+        body = function()
+        timings.append(time.perf_counter() - started)
+    return min(timings), len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', default='100k', help='employees to seed: 1k, 100k, 1m or a number')
+    parser.add_argument('--database', help='database URI, defaults to a temporary SQLite file')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write the JSON results to this file')
+    args = parser.parse_args()
+
+    database = args.database or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = create_app({'database_path': database})
+    employees = parse_scale(args.scale)
+
+    paths = {
+        'orm_serialize_jsonify': orm_jsonify,
+        'rows_orjson' if serialization.orjson else 'rows_stdlib_fallback': rows_dumps,
+        'rows_stdlib': rows_dumps_stdlib,
+        'rows_sparse_fieldset': lambda: rows_dumps(('id', 'firstname', 'lastname')),
+    }
+
+    with app.test_request_context():
+        seed(employees, files_per_employee=0)
+
+        results = {'employees': employees, 'database': database.split(':')[0], 'paths': {}}
+        for name, function in paths.items():
+            seconds, size = best_of(function, args.repeat)
+            results['paths'][name] = {
+                'seconds': round(seconds, 3),
+                'rows_per_second': round(employees / seconds),
+                'bytes': size,
+            }
+
+        baseline = results['paths']['orm_serialize_jsonify']['seconds']
+        for path in results['paths'].values():
+            path['speedup'] = round(baseline / path['seconds'], 2)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
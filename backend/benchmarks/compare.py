@@ -0,0 +1,44 @@
+"""Compares two bench_routes result files, e.g. from two commits.
+
+    python -m benchmarks.compare before.json after.json --threshold 1.2
+
+Exits with status 1 when a route's p50 or p99 grew by more than the
+threshold ratio.
+"""
+import argparse
+import json
+import sys
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=1.2)
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    print('{:<28} {:>10} {:>10} {:>8} {:>10} {:>10} {:>8}'.format(
+        'route', 'p50 before', 'p50 after', 'ratio', 'p99 before', 'p99 after', 'ratio'))
+
+    regressions = []
+    for name in sorted(set(before['routes']) & set(after['routes'])):
+        old, new = before['routes'][name], after['routes'][name]
+        p50_ratio = new['p50_ms'] / old['p50_ms'] if old['p50_ms'] else 0
+        p99_ratio = new['p99_ms'] / old['p99_ms'] if old['p99_ms'] else 0
+        print('{:<28} {:>10} {:>10} {:>8.2f} {:>10} {:>10} {:>8.2f}'.format(
+            name, old['p50_ms'], new['p50_ms'], p50_ratio, old['p99_ms'], new['p99_ms'], p99_ratio))
+        if max(p50_ratio, p99_ratio) > args.threshold:
+            regressions.append(name)
+
+    if regressions:
+        print('\nregressions: {}'.format(', '.join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
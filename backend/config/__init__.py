@@ -0,0 +1,19 @@
+"""Settings of the environment the app runs in.
+
+`APP_CONFIG` (`local`, `qa` or `production`, `local` when unset) picks the
+module; `qa.py` and `production.py` only list what differs from `local.py`.
+Import the result with `from config import config`.
+"""
+import importlib
+import os
+
+from .local import config as defaults
+
+
+ENVIRONMENTS = ('local', 'qa', 'production')
+
+environment = os.environ.get('APP_CONFIG', 'local')
+if environment not in ENVIRONMENTS:
+    raise ValueError('APP_CONFIG must be one of {}, got {!r}'.format(', '.join(ENVIRONMENTS), environment))
+
+config = dict(defaults, **importlib.import_module('config.' + environment).config)
@@ -1,5 +1,61 @@
 config = {
     'DATABASE_URI': 'postgresql://marvin@localhost:5432/maintenancelocal20db',
+    'DATABASE_REPLICA_URI': None,
+    'DATABASE_SCHEMA': 'create',
+    'DATABASE_POOL_SIZE': 5,
+    'DATABASE_MAX_OVERFLOW': 10,
+    'DATABASE_POOL_TIMEOUT': 30,
+    'DATABASE_POOL_RECYCLE': 1800,
+    'DATABASE_POOL_PRE_PING': True,
+    'DATABASE_STATEMENT_TIMEOUT': 30000,
     'SECRET_KEY': 'utecdbp20',
-    'ALGORYTHM': 'HS256'
+    'ALGORYTHM': 'HS256',
+    'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:260000',
+    'PASSWORD_SALT_LENGTH': 16,
+    'PASSWORD_HASH_WORKERS': 2,
+    'PASSWORD_HASH_CONCURRENCY': 4,
+    'PASSWORD_HASH_WAIT': 5,
+    'DEFAULT_PAGE_SIZE': 50,
+    'MAX_PAGE_SIZE': 500,
+    'EXPORT_BATCH_SIZE': 1000,
+    'SEARCH_INDEX_REFRESH_SECONDS': 5,
+    'SEARCH_FETCH_BATCH_SIZE': 500,
+    'TOKEN_CACHE_SIZE': 1024,
+    'ACCESS_TOKEN_MINUTES': 15,
+    'REFRESH_TOKEN_DAYS': 14,
+    'REVOCATION_SYNC_SECONDS': 30,
+    'BULK_INSERT_BATCH_SIZE': 1000,
+    'EMPLOYEE_BATCH_LIMIT': 10000,
+    'ARCHIVE_AFTER_DAYS': 90,
+    'ARCHIVE_BATCH_SIZE': 500,
+    'ARCHIVE_INTERVAL_SECONDS': None,
+    'RESPONSE_CACHE_BACKEND': 'memory',
+    'RESPONSE_CACHE_URL': 'redis://localhost:6379/0',
+    'RESPONSE_CACHE_SIZE': 512,
+    'RESPONSE_CACHE_TTL': 60,
+    'THUMBNAIL_SIZES': (64, 256),
+    'THUMBNAIL_WORKERS': 2,
+    'IMAGE_MAX_AGE': 86400,
+    'FILE_MAX_AGE': 31536000,
+    'COMPRESSION_MIN_SIZE': 1024,
+    'COMPRESSION_LEVELS': {'br': 4, 'zstd': 3, 'gzip': 6},
+    'USE_X_SENDFILE': False,
+    'X_ACCEL_REDIRECT_PREFIX': None,
+    'CORS_ORIGINS': ['http://localhost:8080'],
+    'CORS_METHODS': ['GET', 'PATCH', 'POST', 'DELETE', 'OPTIONS'],
+    'CORS_HEADERS': ['Content-Type', 'X-ACCESS-TOKEN', 'If-None-Match'],
+    'CORS_EXPOSE_HEADERS': ['ETag'],
+    'CORS_MAX_AGE': 86400,
+    'SLOW_QUERY_SECONDS': 0.5,
+    'SLOW_QUERY_EXPLAIN_INTERVAL': 300,
+    'QUERY_BUDGET_DEFAULT': 10,
+    'ENFORCE_QUERY_BUDGETS': False,
+    'PROFILER_SECRET': None,
+    'PROFILER_SAMPLE_RATE': 0.0,
+    'PROFILER_SLOW_SECONDS': 1.0,
+    'PROFILER_FOLDER': 'profiles',
+    'LOG_LEVELS': {
+        'app': 'INFO',
+        'app.authentication': 'WARNING',
+    },
 }
@@ -0,0 +1,11 @@
+config = {
+    'DATABASE_URI': 'postgresql://marvin@localhost:5432/maintenanceprod20db',
+    'DATABASE_REPLICA_URI': None,
+    'DATABASE_SCHEMA': 'check',
+    'DATABASE_POOL_SIZE': 10,
+    'DATABASE_MAX_OVERFLOW': 20,
+    'DATABASE_POOL_TIMEOUT': 10,
+    'DATABASE_POOL_RECYCLE': 1800,
+    'DATABASE_POOL_PRE_PING': True,
+    'DATABASE_STATEMENT_TIMEOUT': 15000,
+}
@@ -1,3 +1,4 @@
 export FLASK_APP=app/
 export FLASK_DEBUG=true
+flask db upgrade
 flask run --port=5002
\ No newline at end of file
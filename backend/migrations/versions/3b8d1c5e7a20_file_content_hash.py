@@ -0,0 +1,28 @@
+"""file content hash
+
+Revision ID: 3b8d1c5e7a20
+Revises: f9e72c63fa7e
+Create Date: 2026-10-18 08:02:47.530114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b8d1c5e7a20'
+down_revision = 'f9e72c63fa7e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('size', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.drop_column('size')
+        batch_op.drop_column('content_hash')
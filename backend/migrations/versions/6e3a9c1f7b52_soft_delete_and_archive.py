@@ -0,0 +1,90 @@
+"""soft delete and archive
+
+Revision ID: 6e3a9c1f7b52
+Revises: d2f6b0a4c815
+Create Date: 2026-10-18 17:05:21.640183
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e3a9c1f7b52'
+down_revision = 'd2f6b0a4c815'
+branch_labels = None
+depends_on = None
+
+
+# name, columns, predicate on Postgres, predicate on SQLite (written the way
+# each dialect renders the queries, or the planner ignores the index)
+PARTIAL_INDEXES = [
+    ('ix_employees_active_created_at_id', ['created_at', 'id'], 'is_active', 'is_active = 1'),
+    ('ix_employees_inactive_deactivated_at', ['deactivated_at'], 'NOT is_active', 'is_active = 0'),
+]
+
+
+def upgrade():
+    op.add_column('employees', sa.Column('deactivated_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('departments', sa.Column('is_active', sa.Boolean(), nullable=False, server_default=sa.true()))
+
+    # employees deactivated before this revision start their archive delay
+    # from their last change
+    employees = sa.table('employees', sa.column('is_active', sa.Boolean()), sa.column('deactivated_at'),
+                         sa.column('modified_at'), sa.column('created_at'))
+    op.execute(employees.update().where(employees.c.is_active == sa.false())
+               .values(deactivated_at=sa.func.coalesce(employees.c.modified_at, employees.c.created_at)))
+
+    op.create_table('employees_archive',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('firstname', sa.String(length=80), nullable=False),
+    sa.Column('lastname', sa.String(length=120), nullable=False),
+    sa.Column('age', sa.Integer(), nullable=False),
+    sa.Column('image', sa.String(length=500), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=False),
+    sa.Column('department_id', sa.String(length=36), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('modified_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('deactivated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('archived_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_employees_archive_department_id'), 'employees_archive', ['department_id'], unique=False)
+    op.create_table('files_archive',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('filename', sa.String(length=120), nullable=False),
+    sa.Column('employee_id', sa.String(length=36), nullable=False),
+    sa.Column('content_hash', sa.String(length=64), nullable=True),
+    sa.Column('size', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('modified_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('archived_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_files_archive_employee_id'), 'files_archive', ['employee_id'], unique=False)
+
+    if op.get_bind().dialect.name == 'postgresql':
+        # same as a51f0d8c92e4: build without blocking writes to employees
+        with op.get_context().autocommit_block():
+            for index_name, columns, postgresql_where, _ in PARTIAL_INDEXES:
+                op.create_index(index_name, 'employees', columns, postgresql_concurrently=True,
+                                postgresql_where=sa.text(postgresql_where))
+        return
+
+    for index_name, columns, _, sqlite_where in PARTIAL_INDEXES:
+        op.create_index(index_name, 'employees', columns, sqlite_where=sa.text(sqlite_where))
+
+
+def downgrade():
+    for index_name, _, _, _ in PARTIAL_INDEXES:
+        op.drop_index(index_name, table_name='employees')
+
+    op.drop_index(op.f('ix_files_archive_employee_id'), table_name='files_archive')
+    op.drop_table('files_archive')
+    op.drop_index(op.f('ix_employees_archive_department_id'), table_name='employees_archive')
+    op.drop_table('employees_archive')
+
+    with op.batch_alter_table('departments', schema=None) as batch_op:
+        batch_op.drop_column('is_active')
+    with op.batch_alter_table('employees', schema=None) as batch_op:
+        batch_op.drop_column('deactivated_at')
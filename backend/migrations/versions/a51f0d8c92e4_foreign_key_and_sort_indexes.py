@@ -0,0 +1,45 @@
+"""foreign key and sort indexes
+
+Revision ID: a51f0d8c92e4
+Revises: 7c4e2a9f1d36
+Create Date: 2026-10-18 10:12:55.873410
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a51f0d8c92e4'
+down_revision = '7c4e2a9f1d36'
+branch_labels = None
+depends_on = None
+
+
+# Foreign keys are not indexed by Postgres on their own: without these,
+# deleting a department or loading an employee's files scans the child table.
+# The composite indexes match the keyset pagination and image lookup orders.
+INDEXES = [
+    ('ix_employees_department_id', 'employees', ['department_id']),
+    ('ix_employees_created_at_id', 'employees', ['created_at', 'id']),
+    ('ix_files_employee_id_created_at', 'files', ['employee_id', 'created_at']),
+    ('ix_departments_name_id', 'departments', ['name', 'id']),
+]
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        # CONCURRENTLY keeps the tables writable while the indexes build, but
+        # cannot run inside the migration transaction.
+        with op.get_context().autocommit_block():
+            for index_name, table_name, columns in INDEXES:
+                op.create_index(index_name, table_name, columns,
+                                postgresql_concurrently=True)
+        return
+
+    for index_name, table_name, columns in INDEXES:
+        op.create_index(index_name, table_name, columns)
+
+
+def downgrade():
+    for index_name, table_name, _ in INDEXES:
+        op.drop_index(index_name, table_name=table_name)
@@ -0,0 +1,29 @@
+"""search index versions
+
+Revision ID: b84d2e6f1a93
+Revises: 6e3a9c1f7b52
+Create Date: 2026-10-19 10:22:48.116530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b84d2e6f1a93'
+down_revision = '6e3a9c1f7b52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    versions = op.create_table('search_index_versions',
+    sa.Column('name', sa.String(length=40), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(versions, [{'name': 'employees', 'version': 0}, {'name': 'departments', 'version': 0}])
+
+
+def downgrade():
+    op.drop_table('search_index_versions')
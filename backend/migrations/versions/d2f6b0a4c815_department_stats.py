@@ -0,0 +1,44 @@
+"""department stats
+
+Revision ID: d2f6b0a4c815
+Revises: a51f0d8c92e4
+Create Date: 2026-10-18 16:12:40.517302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2f6b0a4c815'
+down_revision = 'a51f0d8c92e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('department_stats',
+    sa.Column('department_id', sa.String(length=36), nullable=False),
+    sa.Column('employees', sa.Integer(), nullable=False),
+    sa.Column('active_employees', sa.Integer(), nullable=False),
+    sa.Column('age_total', sa.BigInteger(), nullable=False),
+    sa.Column('files', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['department_id'], ['departments.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('department_id')
+    )
+
+    # the app keeps these rows current from here on, fill them in once
+    op.execute("""
+        INSERT INTO department_stats (department_id, employees, active_employees, age_total, files)
+        SELECT d.id,
+               (SELECT COUNT(*) FROM employees e WHERE e.department_id = d.id),
+               (SELECT COUNT(*) FROM employees e WHERE e.department_id = d.id AND e.is_active),
+               (SELECT COALESCE(SUM(e.age), 0) FROM employees e WHERE e.department_id = d.id),
+               (SELECT COUNT(*) FROM files f JOIN employees e ON e.id = f.employee_id
+                WHERE e.department_id = d.id)
+        FROM departments d
+    """)
+
+
+def downgrade():
+    op.drop_table('department_stats')
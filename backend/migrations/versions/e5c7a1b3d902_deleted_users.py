@@ -0,0 +1,36 @@
+"""deleted users
+
+Revision ID: e5c7a1b3d902
+Revises: b84d2e6f1a93
+Create Date: 2026-10-19 11:05:37.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5c7a1b3d902'
+down_revision = 'b84d2e6f1a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('deleted_users',
+    sa.Column('user_id', sa.String(length=36), nullable=False),
+    sa.Column('expires_at', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    with op.batch_alter_table('deleted_users', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_deleted_users_deleted_at'), ['deleted_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_deleted_users_expires_at'), ['expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('deleted_users', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_deleted_users_expires_at'))
+        batch_op.drop_index(batch_op.f('ix_deleted_users_deleted_at'))
+
+    op.drop_table('deleted_users')
@@ -0,0 +1,44 @@
+"""search trigram indexes
+
+Revision ID: f9e72c63fa7e
+Revises: 44c1b362813f
+Create Date: 2026-10-18 07:21:04.118302
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f9e72c63fa7e'
+down_revision = '44c1b362813f'
+branch_labels = None
+depends_on = None
+
+
+# GIN trigram indexes let Postgres answer ILIKE '%q%' without a sequential
+# scan. Other dialects rely on the in-process index in app/search.py.
+TRIGRAM_INDEXES = [
+    ('ix_employees_firstname_trgm', 'employees', 'firstname'),
+    ('ix_employees_lastname_trgm', 'employees', 'lastname'),
+    ('ix_departments_name_trgm', 'departments', 'name'),
+    ('ix_departments_short_name_trgm', 'departments', 'short_name'),
+]
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for index_name, table_name, column_name in TRIGRAM_INDEXES:
+        op.create_index(index_name, table_name, [column_name],
+                        postgresql_using='gin',
+                        postgresql_ops={column_name: 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    for index_name, table_name, _ in TRIGRAM_INDEXES:
+        op.drop_index(index_name, table_name=table_name)